@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import statistics
+import subprocess
+
+import db
+import gen_data
+import business_import
+import finderqueries
+import populate
+
+#times the finder query functions, the full score recompute and the zipcode load against a
+#synthetic dataset at each --scales size, and writes one JSON file per run to --out
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def timed(fn, *args, repeat=1):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "min_ms": samples[0] * 1000,
+        "p50_ms": statistics.median(samples) * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+def sample_inputs(conn):
+    #the busiest state/city/zipcode/category, which is where slow queries show up first
+    with conn.cursor() as cur:
+        cur.execute("SELECT state, city, COUNT(*) FROM businesses GROUP BY state, city ORDER BY 3 DESC LIMIT 1;")
+        state, city, _ = cur.fetchone()
+        cur.execute("SELECT postal_code, COUNT(*) FROM businesses WHERE city = %s AND state = %s GROUP BY 1 ORDER BY 2 DESC LIMIT 1;",
+                    (city, state))
+        zipcode = cur.fetchone()[0]
+        cur.execute("SELECT category, COUNT(*) FROM business_categories WHERE postal_code = %s GROUP BY 1 ORDER BY 2 DESC LIMIT 1;",
+                    (zipcode,))
+        category = cur.fetchone()[0]
+    conn.commit()
+    return state, city, zipcode, category
+
+def bench_finder(conn, repeat):
+    state, city, zipcode, category = sample_inputs(conn)
+    calls = {
+        "get_states": (finderqueries.get_states.uncached, ()),
+        "get_cities": (finderqueries.get_cities.uncached, (state,)),
+        "get_businesses": (finderqueries.get_businesses, (city, state)),
+        "get_zipcodes": (finderqueries.get_zipcodes.uncached, (city, state)),
+        "get_categories": (finderqueries.get_categories.uncached, (zipcode,)),
+        "get_businesses_by_category": (finderqueries.get_businesses_by_category, (zipcode, category)),
+        "get_zipcode_stats": (finderqueries.get_zipcode_stats, (zipcode,)),
+        "get_popular_businesses": (finderqueries.get_popular_businesses, (zipcode, category)),
+        "get_successful_businesses": (finderqueries.get_successful_businesses, (zipcode, category)),
+        "get_search_bundle": (finderqueries.get_search_bundle, (zipcode, category)),
+    }
+    results = {}
+    for name, (fn, args) in calls.items():
+        samples, rows = timed(fn, conn, *args, repeat=repeat)
+        conn.commit()
+        results[name] = summarize(samples)
+        results[name]["rows"] = len(rows) if isinstance(rows, list) else 1
+    return results
+
+def run_scale(scale, seed, repeat, workers):
+    result = {"scale": scale}
+    conn = db.connect_db(application_name="yelpsim-bench")
+    counts = gen_data.load(conn, scale, seed=seed)
+    zipcodes = counts.pop("zipcodes")
+    result["rows"] = counts
+
+    #first load inserts everything, the second one is the unchanged-data case
+    samples, load_counts = timed(populate.insert_data_into_db, conn, zipcodes)
+    result["populate_insert"] = {**summarize(samples), **load_counts}
+    samples, load_counts = timed(populate.insert_data_into_db, conn, zipcodes)
+    result["populate_unchanged"] = {**summarize(samples), **load_counts}
+    conn.close()
+
+    samples, _ = timed(lambda: business_import.main(full=True, restart=True, workers=workers))
+    result["import_full"] = summarize(samples)
+
+    with db.connection() as conn:
+        result["finder"] = bench_finder(conn, repeat)
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark against synthetic data. Drops and reloads the configured database's tables!")
+    parser.add_argument("--scales", default="10000,100000,1000000", help="comma-separated business counts")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20, help="runs per finder query")
+    parser.add_argument("--workers", type=int, default=1, help="business_import worker processes")
+    parser.add_argument("--out", default="bench_results")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "results": [],
+    }
+    for scale in (int(s) for s in args.scales.split(",")):
+        print(f"scale {scale:,}...")
+        report["results"].append(run_scale(scale, args.seed, args.repeat, args.workers))
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{report['commit']}-{report['started_at'].replace(':', '')}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"wrote {path}")
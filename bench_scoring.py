@@ -0,0 +1,52 @@
+import time
+import argparse
+import datetime
+import numpy as np
+
+from scoring import (
+    calculate_popularity_score, calculate_success_score,
+    popularity_scores, success_scores,
+)
+
+def make_columns(n, seed=0):
+    rng = np.random.default_rng(seed)
+    numCheckins = rng.zipf(1.8, n).clip(max=100000).astype(np.float64)
+    review_counts = rng.zipf(1.6, n).clip(max=100000).astype(np.float64)
+    avg_ratings = rng.uniform(1, 5, n)
+    avg_ratings[review_counts == 0] = np.nan
+    today = datetime.date.today()
+    last_review_dates = [today - datetime.timedelta(days=int(d)) for d in rng.integers(0, 3650, n)]
+    return numCheckins, review_counts, avg_ratings, last_review_dates
+
+def bench_scalar(numCheckins, review_counts, avg_ratings, last_review_dates):
+    popularity = [calculate_popularity_score(c, r) for c, r in zip(numCheckins.tolist(), review_counts.tolist())]
+    success = [calculate_success_score(d, a, c) for d, a, c in
+               zip(last_review_dates, avg_ratings.tolist(), numCheckins.tolist())]
+    return np.array(popularity), np.array(success)
+
+def bench_vectorized(numCheckins, review_counts, avg_ratings, last_review_dates):
+    return popularity_scores(numCheckins, review_counts), success_scores(last_review_dates, avg_ratings, numCheckins)
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    columns = make_columns(args.rows)
+    scalar_time, (scalar_pop, scalar_succ) = timed(bench_scalar, *columns, repeat=1)
+    vector_time, (vector_pop, vector_succ) = timed(bench_vectorized, *columns)
+
+    #nan ratings are scored as 0 by both paths
+    scalar_succ = np.nan_to_num(scalar_succ)
+    assert np.allclose(scalar_pop, vector_pop) and np.allclose(scalar_succ, vector_succ)
+    print(f"rows:       {args.rows:,}")
+    print(f"scalar:     {scalar_time * 1000:,.1f} ms")
+    print(f"vectorized: {vector_time * 1000:,.1f} ms ({scalar_time / max(vector_time, 1e-9):,.0f}x)")
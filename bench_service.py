@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import subprocess
+from collections import Counter
+from urllib.parse import urlencode
+
+from bench import git_commit, summarize
+
+#load test for finder_service: hundreds of keep-alive clients replaying a mix of finder requests
+#for a fixed duration, reporting throughput, latency percentiles and how many queries coalesced
+
+async def request(reader, writer, host, path):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    body = await reader.readexactly(length)
+    return status, body
+
+async def get_json(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        status, body = await request(reader, writer, host, path)
+    finally:
+        writer.close()
+    if status != 200:
+        raise RuntimeError(f"{path}: HTTP {status} {body[:200]!r}")
+    return json.loads(body)
+
+def url(path, **params):
+    return f"{path}?{urlencode(params)}" if params else path
+
+async def build_workload(host, port, locations, rng):
+    #walks state -> city -> zipcode -> category through the API itself, like a GUI user would
+    paths = ["/states"]
+    states = [row["state"] for row in await get_json(host, port, "/states")]
+    for _ in range(locations):
+        state = rng.choice(states)
+        cities = [row["city"] for row in await get_json(host, port, url("/cities", state=state))]
+        if not cities:
+            continue
+        city = rng.choice(cities)
+        zipcodes = [row["zipcode"] for row in await get_json(host, port, url("/zipcodes", city=city, state=state))]
+        paths += [url("/cities", state=state), url("/zipcodes", city=city, state=state)]
+        if not zipcodes:
+            continue
+        zipcode = rng.choice(zipcodes)
+        categories = [row["category"] for row in await get_json(host, port, url("/categories", zipcode=zipcode))]
+        paths += [url("/categories", zipcode=zipcode), url("/stats", zipcode=zipcode)]
+        for category in rng.sample(categories, min(3, len(categories))):
+            paths += [url(endpoint, zipcode=zipcode, category=category)
+                      for endpoint in ("/businesses", "/popular", "/successful")]
+        paths.append(url("/search", q=city[:3], state=state))
+    return paths
+
+async def client(host, port, paths, deadline, rng, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, host, rng.choice(paths))
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+    except (ConnectionError, asyncio.IncompleteReadError, IndexError) as e:
+        statuses[type(e).__name__] += 1
+    finally:
+        writer.close()
+
+async def run(host, port, clients, duration, locations, seed):
+    rng = random.Random(seed)
+    paths = await build_workload(host, port, locations, rng)
+    before = await get_json(host, port, "/health")
+    latencies, statuses = [], Counter()
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, paths, deadline, random.Random(seed + i), latencies, statuses)
+                           for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    after = await get_json(host, port, "/health")
+    return {
+        "clients": clients,
+        "duration_s": elapsed,
+        "distinct_requests": len(set(paths)),
+        "requests": len(latencies),
+        "requests_per_s": len(latencies) / elapsed,
+        "latency": summarize(latencies) if latencies else None,
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "service": {key: after[key] - before.get(key, 0) for key in after if key != "in_flight"},
+    }
+
+async def wait_for_service(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await get_json(host, port, "/health")
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test finder_service against the configured database")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--clients", default="50,200,500", help="comma-separated concurrent client counts")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per client count")
+    parser.add_argument("--locations", type=int, default=20, help="random state/city/zipcode picks in the workload")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--spawn", action="store_true", help="start finder_service.py for the run")
+    parser.add_argument("--out", default="bench_results")
+    args = parser.parse_args()
+
+    service = None
+    if args.spawn:
+        service = subprocess.Popen([sys.executable, "finder_service.py", "--host", args.host, "--port", str(args.port)])
+    try:
+        asyncio.run(wait_for_service(args.host, args.port))
+        report = {
+            "commit": git_commit(),
+            "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "results": [],
+        }
+        for clients in (int(c) for c in args.clients.split(",")):
+            result = asyncio.run(run(args.host, args.port, clients, args.duration, args.locations, args.seed))
+            latency = result["latency"] or {}
+            print(f"{clients} clients: {result['requests_per_s']:,.0f} req/s, p50 {latency.get('p50_ms', 0):.1f}ms, "
+                  f"p95 {latency.get('p95_ms', 0):.1f}ms, statuses {result['statuses']}, "
+                  f"coalesced {result['service'].get('coalesced', 0)}")
+            report["results"].append(result)
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"service-{report['commit']}-{report['started_at'].replace(':', '')}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"wrote {path}")
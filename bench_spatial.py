@@ -0,0 +1,76 @@
+import time
+import argparse
+import numpy as np
+
+from spatial import GridIndex, naive_nearest, naive_within
+
+#grid index vs a full haversine scan for k-nearest and radius queries. Points cluster around
+#random "cities" across the continental US like real business data does, or come from a snapshot
+
+def make_points(n, cities=300, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.column_stack([rng.uniform(25, 49, cities), rng.uniform(-124, -67, cities)])
+    which = rng.zipf(1.5, n) % cities
+    latitudes = centers[which, 0] + rng.normal(0, 0.08, n)
+    longitudes = centers[which, 1] + rng.normal(0, 0.08, n)
+    return latitudes, longitudes
+
+def query_points(latitudes, longitudes, count, seed=1):
+    #queries start at real businesses, nudged a little, which is how the finder uses it
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(latitudes), count)
+    return latitudes[picks] + rng.normal(0, 0.01, count), longitudes[picks] + rng.normal(0, 0.01, count)
+
+def timed_queries(fn, query_lats, query_lons):
+    results = []
+    start = time.perf_counter()
+    for latitude, longitude in zip(query_lats, query_lons):
+        results.append(fn(latitude, longitude))
+    return (time.perf_counter() - start) / len(query_lats), results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--snapshot", metavar="PATH", help="use the coordinates in a snapshot instead of synthetic points")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--radius-km", type=float, default=2.0)
+    parser.add_argument("--cell-km", type=float, default=2.0)
+    args = parser.parse_args()
+
+    if args.snapshot:
+        from snapshot import Snapshot
+        snapshot = Snapshot.load(args.snapshot)
+        latitudes = np.asarray(snapshot.columns["latitude"])
+        longitudes = np.asarray(snapshot.columns["longitude"])
+        valid = np.isfinite(latitudes) & np.isfinite(longitudes)
+        query_lats, query_lons = query_points(latitudes[valid], longitudes[valid], args.queries)
+    else:
+        latitudes, longitudes = make_points(args.rows)
+        query_lats, query_lons = query_points(latitudes, longitudes, args.queries)
+
+    start = time.perf_counter()
+    index = GridIndex(latitudes, longitudes, cell_km=args.cell_km)
+    build_time = time.perf_counter() - start
+
+    grid_knn, grid_knn_results = timed_queries(lambda lat, lon: index.nearest(lat, lon, args.k), query_lats, query_lons)
+    naive_knn, naive_knn_results = timed_queries(lambda lat, lon: naive_nearest(latitudes, longitudes, lat, lon, args.k),
+                                                 query_lats, query_lons)
+    grid_radius, grid_radius_results = timed_queries(lambda lat, lon: index.within(lat, lon, args.radius_km),
+                                                     query_lats, query_lons)
+    naive_radius, naive_radius_results = timed_queries(
+        lambda lat, lon: naive_within(latitudes, longitudes, lat, lon, args.radius_km), query_lats, query_lons)
+
+    #same distances back from both paths; rows can differ only where distances tie
+    for (_, grid_d), (_, naive_d) in zip(grid_knn_results, naive_knn_results):
+        assert np.allclose(grid_d, naive_d)
+    for (grid_rows, _), (naive_rows, _) in zip(grid_radius_results, naive_radius_results):
+        assert np.array_equal(np.sort(grid_rows), naive_rows)
+    found = np.mean([len(rows) for rows, _ in grid_radius_results])
+
+    print(f"points:       {len(index):,} ({args.queries} queries, cell {args.cell_km} km)")
+    print(f"grid build:   {build_time * 1000:,.1f} ms")
+    print(f"knn k={args.k}:     grid {grid_knn * 1000:,.3f} ms, naive {naive_knn * 1000:,.3f} ms "
+          f"({naive_knn / max(grid_knn, 1e-9):,.0f}x)")
+    print(f"radius {args.radius_km} km: grid {grid_radius * 1000:,.3f} ms, naive {naive_radius * 1000:,.3f} ms "
+          f"({naive_radius / max(grid_radius, 1e-9):,.0f}x, {found:,.0f} found on average)")
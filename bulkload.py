@@ -0,0 +1,66 @@
+import io
+from psycopg2 import sql
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, float):
+        return repr(value)
+    #escape the characters COPY's text format treats specially
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def copy_rows(cursor, table, columns, rows):
+    buf = io.StringIO()
+    count = 0
+    for row in rows:
+        buf.write("\t".join(_copy_value(value) for value in row))
+        buf.write("\n")
+        count += 1
+    buf.seek(0)
+    statement = sql.SQL("COPY {} ({}) FROM STDIN").format(
+        sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns))
+    )
+    cursor.copy_expert(statement.as_string(cursor), buf)
+    return count
+
+def diff_upsert(conn, target, key_columns, value_columns, rows):
+    #COPY into an unlogged staging copy of target, then only touch rows that actually differ,
+    #so a reload of unchanged data writes no new tuples and almost no WAL
+    staging = f"{target}_staging"
+    columns = list(key_columns) + list(value_columns)
+    target_id, staging_id = sql.Identifier(target), sql.Identifier(staging)
+    keys_match = sql.SQL(" AND ").join(
+        sql.SQL("t.{0} = s.{0}").format(sql.Identifier(c)) for c in key_columns
+    )
+    target_values = sql.SQL(", ").join(sql.SQL("t.{}").format(sql.Identifier(c)) for c in value_columns)
+    staging_values = sql.SQL(", ").join(sql.SQL("s.{}").format(sql.Identifier(c)) for c in value_columns)
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL("CREATE UNLOGGED TABLE IF NOT EXISTS {} (LIKE {} INCLUDING DEFAULTS);").format(
+            staging_id, target_id))
+        cursor.execute(sql.SQL("TRUNCATE {};").format(staging_id))
+        staged = copy_rows(cursor, staging, columns, rows)
+        cursor.execute(sql.SQL("ANALYZE {};").format(staging_id))
+
+        cursor.execute(sql.SQL("""
+            UPDATE {target} t SET ({values}) = ROW({new_values})
+            FROM {staging} s
+            WHERE {keys_match} AND ({old_values}) IS DISTINCT FROM ({new_values});
+        """).format(
+            target=target_id, staging=staging_id, keys_match=keys_match,
+            values=sql.SQL(", ").join(map(sql.Identifier, value_columns)),
+            old_values=target_values, new_values=staging_values,
+        ))
+        updated = cursor.rowcount
+
+        cursor.execute(sql.SQL("""
+            INSERT INTO {target} ({columns})
+            SELECT {columns} FROM {staging} s
+            WHERE NOT EXISTS (SELECT 1 FROM {target} t WHERE {keys_match});
+        """).format(target=target_id, staging=staging_id, columns=column_list, keys_match=keys_match))
+        inserted = cursor.rowcount
+
+        cursor.execute(sql.SQL("TRUNCATE {};").format(staging_id))
+    conn.commit()
+    return {"inserted": inserted, "updated": updated, "unchanged": staged - inserted - updated}
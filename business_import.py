@@ -1,78 +1,529 @@
-import psycopg2
+import time
+import argparse
+import multiprocessing
+import queue
 import datetime
 
-def connect_db():
-    return psycopg2.connect(
-        dbname="milestone1db",
-        user="postgres",
-        password="admin",
-        host="localhost"
-    )
+import db
+import bulkload
+import rollups
+import snapshot
+from scoring import metric_columns, popularity_scores, success_scores
+
+METRIC_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS reviews_business_metrics_idx ON Reviews (business_id) INCLUDE (user_id, stars, date);",
+    "CREATE INDEX IF NOT EXISTS checkins_business_metrics_idx ON CheckIns (business_id) INCLUDE (user_id);",
+    "CREATE INDEX IF NOT EXISTS reviews_date_idx ON Reviews (date) INCLUDE (business_id);",
+    "CREATE INDEX IF NOT EXISTS checkins_checkin_id_idx ON CheckIns (checkin_id) INCLUDE (business_id);",
+]
+
+#back the finder's top-N panels, see finderqueries.get_popular_businesses
+#business_id is included for the category EXISTS probe, so the scan stays index-only
+RANKING_INDEXES = [
+    #earlier versions without business_id
+    "DROP INDEX IF EXISTS businesses_zip_popularity_idx;",
+    "DROP INDEX IF EXISTS businesses_zip_success_idx;",
+    """CREATE INDEX IF NOT EXISTS businesses_zip_popularity_cover_idx ON Businesses (postal_code, popularity_score DESC NULLS LAST)
+       INCLUDE (business_id, name, stars, review_count, "numCheckins");""",
+    """CREATE INDEX IF NOT EXISTS businesses_zip_success_cover_idx ON Businesses (postal_code, success_score DESC NULLS LAST)
+       INCLUDE (business_id, name, review_count, "numCheckins");""",
+]
 
-def fetch_business_metrics(cursor):
+#back the finder's name search: a trigram index for substring matches ranked by similarity,
+#and lower(name) prefix indexes for inputs too short to have trigrams. The prefix indexes use the
+#C collation so one btree serves both the LIKE prefix and the ORDER BY, and LIMIT stops the scan early
+SEARCH_INDEXES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+    "CREATE INDEX IF NOT EXISTS businesses_name_trgm_idx ON Businesses USING gist (name gist_trgm_ops);",
+    #text_pattern_ops versions, they could not supply the result order
+    "DROP INDEX IF EXISTS businesses_name_prefix_idx;",
+    "DROP INDEX IF EXISTS businesses_city_name_prefix_idx;",
+    """CREATE INDEX IF NOT EXISTS businesses_name_c_prefix_idx
+       ON Businesses ((lower(name) COLLATE "C"), business_id);""",
+    """CREATE INDEX IF NOT EXISTS businesses_city_name_c_prefix_idx
+       ON Businesses (state, city, (lower(name) COLLATE "C"), business_id);""",
+]
+
+def create_metric_indexes(cursor):
+    for statement in METRIC_INDEXES + RANKING_INDEXES + SEARCH_INDEXES:
+        cursor.execute(statement)
+    cursor.connection.commit()
+
+def sync_business_categories(cursor):
+    #one row per (business, category) with the zipcode copied in, so per-zipcode category
+    #filters are an index lookup instead of a LIKE scan over the categories string
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS business_categories (
+            business_id VARCHAR NOT NULL,
+            postal_code VARCHAR,
+            category VARCHAR NOT NULL,
+            PRIMARY KEY (business_id, category)
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS business_categories_zip_idx ON business_categories (postal_code, category, business_id);")
+    cursor.execute("""
+        CREATE TEMP TABLE current_categories ON COMMIT DROP AS
+        SELECT DISTINCT business_id, postal_code, category
+        FROM (
+            SELECT business_id, postal_code, trim(regexp_split_to_table(categories, ',')) AS category
+            FROM Businesses
+            WHERE categories IS NOT NULL
+        ) AS split
+        WHERE category <> '';
+    """)
+    cursor.execute("""
+        DELETE FROM business_categories bc
+        WHERE NOT EXISTS (
+            SELECT 1 FROM current_categories c
+            WHERE c.business_id = bc.business_id AND c.category = bc.category
+            AND c.postal_code IS NOT DISTINCT FROM bc.postal_code
+        );
+    """)
+    removed = cursor.rowcount
     cursor.execute("""
+        INSERT INTO business_categories (business_id, postal_code, category)
+        SELECT business_id, postal_code, category FROM current_categories
+        ON CONFLICT (business_id, category) DO NOTHING;
+    """)
+    added = cursor.rowcount
+    cursor.connection.commit()
+    return added, removed
+
+#reviews and checkins are aggregated on their own and then joined, so a business
+#with R reviews and C checkins produces R + C rows instead of R * C
+METRICS_QUERY_TEMPLATE = """
+    WITH review_metrics AS (
+        SELECT 
+            business_id,
+            COUNT(DISTINCT user_id) AS review_count,
+            AVG(stars) AS avg_rating,
+            MAX(date) AS last_review_date
+        FROM Reviews
+        {scope}
+        GROUP BY business_id
+    ),
+    checkin_metrics AS (
         SELECT 
-            b.business_id,
-            COUNT(DISTINCT r.user_id) AS review_count,
-            COUNT(DISTINCT ci.user_id) AS numCheckins,
-            AVG(r.stars) AS avg_rating,
-            MAX(r.date) AS last_review_date
-        FROM 
-            Businesses b
-        LEFT JOIN Reviews r ON r.business_id = b.business_id
-        LEFT JOIN CheckIns ci ON ci.business_id = b.business_id
-        GROUP BY b.business_id
+            business_id,
+            COUNT(DISTINCT user_id) AS numCheckins
+        FROM CheckIns
+        {scope}
+        GROUP BY business_id
+    )
+    SELECT 
+        b.business_id,
+        COALESCE(rm.review_count, 0) AS review_count,
+        COALESCE(cm.numCheckins, 0) AS numCheckins,
+        rm.avg_rating,
+        rm.last_review_date
+    FROM 
+        Businesses b
+    LEFT JOIN review_metrics rm ON rm.business_id = b.business_id
+    LEFT JOIN checkin_metrics cm ON cm.business_id = b.business_id
+    {scope_b}
+"""
+
+def metrics_query(incremental=False, resume=False, lower=False, upper=False):
+    conditions = []
+    if incremental:
+        #only businesses listed in touched_businesses, see collect_touched_businesses
+        conditions.append("{col} IN (SELECT business_id FROM touched_businesses)")
+    if resume:
+        conditions.append("{col} > %(after_id)s")
+    #a business_id range partition, a range scan on the business_id indexes of Reviews and CheckIns
+    if lower:
+        conditions.append("{col} >= %(lower)s")
+    if upper:
+        conditions.append("{col} < %(upper)s")
+    scope = " AND ".join(conditions)
+    return METRICS_QUERY_TEMPLATE.format(
+        scope="WHERE " + scope.format(col="business_id") if scope else "",
+        scope_b="WHERE " + scope.format(col="b.business_id") if scope else "",
+    )
+
+METRICS_QUERY = metrics_query()
+
+#the original fan-out query, kept so --check can compare against it
+JOINED_METRICS_QUERY = """
+    SELECT 
+        b.business_id,
+        COUNT(DISTINCT r.user_id) AS review_count,
+        COUNT(DISTINCT ci.user_id) AS numCheckins,
+        AVG(r.stars) AS avg_rating,
+        MAX(r.date) AS last_review_date
+    FROM 
+        Businesses b
+    LEFT JOIN Reviews r ON r.business_id = b.business_id
+    LEFT JOIN CheckIns ci ON ci.business_id = b.business_id
+    GROUP BY b.business_id
+"""
+
+def stream_business_metrics(conn, batch_size, incremental=False, after_id=None, partition=None):
+    #named cursor keeps the result on the server, withhold lets it survive the per-batch commits
+    cursor = conn.cursor(name="business_metrics", withhold=True)
+    cursor.itersize = batch_size
+    lower, upper = partition or (None, None)
+    params = {"after_id": after_id, "lower": lower, "upper": upper}
+    try:
+        query = metrics_query(incremental=incremental, resume=after_id is not None,
+                              lower=lower is not None, upper=upper is not None)
+        cursor.execute(query + " ORDER BY b.business_id", params)
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+    finally:
+        cursor.close()
+
+def create_checkpoint_table(cursor):
+    #target_* is the watermark the checkpointed run will save when it finishes, full_run whether it
+    #was recomputing every business or only the touched ones
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS import_checkpoint (
+            job VARCHAR PRIMARY KEY,
+            last_business_id VARCHAR,
+            target_review_date TIMESTAMP,
+            target_checkin_id BIGINT,
+            full_run BOOLEAN,
+            updated_at TIMESTAMP DEFAULT now()
+        );
     """)
-    return cursor.fetchall()
+    cursor.execute("ALTER TABLE import_checkpoint ADD COLUMN IF NOT EXISTS target_review_date TIMESTAMP;")
+    cursor.execute("ALTER TABLE import_checkpoint ADD COLUMN IF NOT EXISTS target_checkin_id BIGINT;")
+    cursor.execute("ALTER TABLE import_checkpoint ADD COLUMN IF NOT EXISTS full_run BOOLEAN;")
+
+def load_checkpoint(cursor, job="scores"):
+    create_checkpoint_table(cursor)
+    cursor.execute("SELECT last_business_id FROM import_checkpoint WHERE job = %s;", (job,))
+    row = cursor.fetchone()
+    cursor.connection.commit()
+    return row[0] if row else None
 
-def calculate_popularity_score(numCheckins, review_count):
-    checkin_weight = 0.5
-    review_weight = 0.5
+def load_checkpoint_target(cursor):
+    #the watermark an interrupted run was heading for and whether it was a full run, shared by all
+    #of the family's checkpoints. the oldest one wins if they ever disagree, that only means
+    #redoing a little more next run
+    create_checkpoint_table(cursor)
+    cursor.execute("""
+        SELECT target_review_date, target_checkin_id, full_run FROM import_checkpoint
+        WHERE job = 'scores' OR job LIKE 'scores:%'
+        ORDER BY updated_at
+        LIMIT 1;
+    """)
+    row = cursor.fetchone()
+    cursor.connection.commit()
+    if row is None:
+        return None, None
+    if row[:2] == (None, None):
+        #written before targets were stored, there is no safe watermark to finish it with
+        clear_checkpoints(cursor)
+        return None, None
+    #checkpoints from before the mode was stored are finished as full runs, which covers either
+    return row[:2], row[2] is not False
 
-    popularity_score = (checkin_weight * numCheckins) + \
-                       (review_weight * review_count)
+def save_checkpoint(cursor, last_business_id, watermark, full_run, job="scores"):
+    #no commit here, it goes out in the same transaction as the batch it describes
+    cursor.execute("""
+        INSERT INTO import_checkpoint (job, last_business_id, target_review_date, target_checkin_id, full_run,
+                                       updated_at)
+        VALUES (%s, %s, %s, %s, %s, now())
+        ON CONFLICT (job) DO UPDATE SET
+        last_business_id = EXCLUDED.last_business_id,
+        target_review_date = EXCLUDED.target_review_date,
+        target_checkin_id = EXCLUDED.target_checkin_id,
+        full_run = EXCLUDED.full_run,
+        updated_at = EXCLUDED.updated_at;
+    """, (job, last_business_id) + tuple(watermark) + (full_run,))
 
-    return popularity_score
+def clear_checkpoint(cursor, job="scores"):
+    cursor.execute("DELETE FROM import_checkpoint WHERE job = %s;", (job,))
+    cursor.connection.commit()
 
-def calculate_success_score(last_review_date, avg_rating, numCheckins):
-    checkin_weight = 0.4
-    review_weight = 0.2
-    avg_rating = .4
-    #business_age = (datetime.datetime.now() - last_review_date).days / 365
-    
-    #normalize avg_rating by dividing by 5
-    normalized_review_rating = avg_rating / 5
-    
-    #num checkins shouldnt devide by zero
-    success_score = (checkin_weight * (numCheckins / float(max(numCheckins, 1)))) + \
-                    (review_weight * normalized_review_rating)
-    return success_score
+def clear_checkpoints(cursor):
+    #every checkpoint of the scores job, serial and per partition
+    cursor.execute("DELETE FROM import_checkpoint WHERE job = 'scores' OR job LIKE 'scores:%';")
+    cursor.connection.commit()
+
+def load_watermark(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS import_watermark (
+            job VARCHAR PRIMARY KEY,
+            last_review_date TIMESTAMP,
+            last_checkin_id BIGINT,
+            updated_at TIMESTAMP DEFAULT now()
+        );
+    """)
+    cursor.execute("SELECT last_review_date, last_checkin_id FROM import_watermark WHERE job = 'scores';")
+    return cursor.fetchone()
+
+def current_watermark(cursor):
+    cursor.execute("SELECT MAX(date) FROM Reviews;")
+    last_review_date = cursor.fetchone()[0]
+    cursor.execute("SELECT MAX(checkin_id) FROM CheckIns;")
+    last_checkin_id = cursor.fetchone()[0]
+    return last_review_date, last_checkin_id
+
+def save_watermark(cursor, watermark):
+    last_review_date, last_checkin_id = watermark
+    cursor.execute("""
+        INSERT INTO import_watermark (job, last_review_date, last_checkin_id, updated_at)
+        VALUES ('scores', %s, %s, now())
+        ON CONFLICT (job) DO UPDATE SET
+        last_review_date = EXCLUDED.last_review_date,
+        last_checkin_id = EXCLUDED.last_checkin_id,
+        updated_at = EXCLUDED.updated_at;
+    """, (last_review_date, last_checkin_id))
+    cursor.connection.commit()
+
+def collect_touched_businesses(cursor, watermark):
+    last_review_date, last_checkin_id = watermark
+    #a real (unlogged) table rather than a temp one so parallel workers can see it
+    cursor.execute("DROP TABLE IF EXISTS touched_businesses;")
+    #>= on the date so reviews landing on the boundary timestamp are never missed
+    cursor.execute("""
+        CREATE UNLOGGED TABLE touched_businesses AS
+        SELECT business_id FROM Reviews WHERE date >= %s
+        UNION
+        SELECT business_id FROM CheckIns WHERE checkin_id > %s;
+    """, (last_review_date or datetime.datetime.min, last_checkin_id or 0))
+    cursor.execute("ALTER TABLE touched_businesses ADD PRIMARY KEY (business_id);")
+    cursor.execute("ANALYZE touched_businesses;")
+    cursor.execute("SELECT COUNT(*) FROM touched_businesses;")
+    touched = cursor.fetchone()[0]
+    cursor.connection.commit()
+    return touched
+
+def check_business_metrics(cursor):
+    cursor.execute(METRICS_QUERY + " ORDER BY business_id")
+    new_rows = cursor.fetchall()
+    cursor.execute(JOINED_METRICS_QUERY + " ORDER BY b.business_id")
+    old_rows = cursor.fetchall()
+
+    mismatches = []
+    if len(new_rows) != len(old_rows):
+        mismatches.append(("row count", len(old_rows), len(new_rows)))
+    for old, new in zip(old_rows, new_rows):
+        same_avg = (old[3] is None and new[3] is None) or \
+                   (old[3] is not None and new[3] is not None and abs(float(old[3]) - float(new[3])) < 1e-9)
+        if old[:3] != new[:3] or old[4] != new[4] or not same_avg:
+            mismatches.append((old[0], old, new))
+    return mismatches
+
+def score_businesses(business_metrics):
+    business_ids, review_counts, numCheckins, avg_ratings, last_review_dates = metric_columns(business_metrics)
+    popularity = popularity_scores(numCheckins, review_counts)
+    success = success_scores(last_review_dates, avg_ratings, numCheckins)
+    return zip(business_ids, popularity.tolist(), success.tolist())
 
 def update_businesses(cursor, business_metrics):
-    for metrics in business_metrics:
-        business_id, review_count, numCheckins, avg_rating, last_review_date = metrics
-        popularity_score = calculate_popularity_score(numCheckins, review_count, avg_rating)
-        success_score = calculate_success_score(last_review_date, avg_rating, numCheckins, review_count)
+    count = 0
+    for business_id, popularity_score, success_score in score_businesses(business_metrics):
         cursor.execute("""
             UPDATE Businesses
             SET 
                 popularity_score = %s,
                 success_score = %s
             WHERE business_id = %s;
-        """, (review_count, numCheckins, avg_rating, popularity_score, success_score, business_id))
+        """, (popularity_score, success_score, business_id))
+        count += 1
+    return count
+
+def bulk_update_businesses(cursor, business_metrics):
+    #stage everything with COPY, then apply it with one set-based UPDATE
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS score_staging (
+            business_id VARCHAR PRIMARY KEY,
+            popularity_score DOUBLE PRECISION,
+            success_score DOUBLE PRECISION
+        ) ON COMMIT DELETE ROWS;
+    """)
+    count = bulkload.copy_rows(cursor, "score_staging", ["business_id", "popularity_score", "success_score"],
+                               score_businesses(business_metrics))
+    cursor.execute("ANALYZE score_staging;")
+    cursor.execute("""
+        UPDATE Businesses b
+        SET 
+            popularity_score = s.popularity_score,
+            success_score = s.success_score
+        FROM score_staging s
+        WHERE b.business_id = s.business_id;
+    """)
+    return count
+
+def run_pipeline(conn, watermark, per_row=False, batch_size=10000, incremental=False, after_id=None,
+                 partition=None, job="scores", progress=None):
+    cursor = conn.cursor()
+    write = update_businesses if per_row else bulk_update_businesses
+    total = 0
+    start = time.perf_counter()
+    for batch in stream_business_metrics(conn, batch_size, incremental=incremental,
+                                         after_id=after_id, partition=partition):
+        count = write(cursor, batch)
+        save_checkpoint(cursor, batch[-1][0], watermark, not incremental, job)
+        conn.commit()
+        total += count
+        if progress is not None:
+            progress.put((job, count))
+        else:
+            elapsed = time.perf_counter() - start
+            print(f"committed {total} rows through {batch[-1][0]} ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+    cursor.close()
+    return total, time.perf_counter() - start
+
+def partition_bounds(cursor, partitions, incremental=False):
+    #business_id ranges holding about the same number of businesses to recompute, as
+    #(lower, upper) pairs with None for an open end
+    source = "touched_businesses" if incremental else "Businesses"
+    cursor.execute(f"""
+        SELECT MIN(business_id) FROM (
+            SELECT business_id, ntile(%s) OVER (ORDER BY business_id) AS tile FROM {source}
+        ) tiles
+        GROUP BY tile
+        ORDER BY tile;
+    """, (partitions,))
+    starts = [row[0] for row in cursor.fetchall()][1:]
     cursor.connection.commit()
+    return list(zip([None] + starts, starts + [None]))
+
+def partition_worker(task):
+    partition, bounds, watermark, per_row, batch_size, incremental, restart, progress = task
+    #the bounds are part of the name, a checkpoint only resumes the exact same range
+    job = f"scores:{partition}/{bounds[0] or ''}..{bounds[1] or ''}"
+    try:
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            after_id = None if restart else load_checkpoint(cursor, job)
+            count, elapsed = run_pipeline(conn, watermark, per_row=per_row, batch_size=batch_size,
+                                          incremental=incremental, after_id=after_id,
+                                          partition=bounds, job=job,
+                                          progress=progress)
+            clear_checkpoint(cursor, job)
+            cursor.close()
+        return job, count, elapsed, None
+    except Exception as e:
+        return job, 0, 0.0, f"{type(e).__name__}: {e}"
+
+def run_parallel(workers, bounds, watermark, per_row=False, batch_size=10000, incremental=False, restart=False):
+    start = time.perf_counter()
+    with multiprocessing.Manager() as manager:
+        progress = manager.Queue()
+        tasks = [(partition, partition_range, watermark, per_row, batch_size, incremental, restart, progress)
+                 for partition, partition_range in enumerate(bounds)]
+        with multiprocessing.Pool(workers) as pool:
+            pending = pool.map_async(partition_worker, tasks)
+            total = 0
+            while True:
+                try:
+                    job, count = progress.get(timeout=1)
+                    total += count
+                    elapsed = time.perf_counter() - start
+                    print(f"[{job}] +{count}, {total} rows committed overall ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+                except queue.Empty:
+                    if pending.ready():
+                        break
+            results = pending.get()
+
+    errors = [(job, error) for job, _, _, error in results if error]
+    for job, error in errors:
+        print(f"[{job}] failed: {error}")
+    count = sum(result[1] for result in results)
+    return count, time.perf_counter() - start, errors
 
-def main():
-    conn = connect_db()
+def main(per_row=False, check=False, full=False, batch_size=10000, restart=False, workers=1, partitions=None):
+    conn = db.getconn()
     cursor = conn.cursor()
-    
-    business_metrics = fetch_business_metrics(cursor)
-    
-    update_businesses(cursor, business_metrics)
+
+    create_metric_indexes(cursor)
+
+    if check:
+        mismatches = check_business_metrics(cursor)
+        for mismatch in mismatches[:20]:
+            print(f"mismatch: {mismatch}")
+        print(f"metrics check: {len(mismatches)} mismatches")
+        cursor.close()
+        db.putconn(conn)
+        return
+
+    added, removed = sync_business_categories(cursor)
+    print(f"business_categories: {added} added, {removed} removed")
+
+    previous_watermark = load_watermark(cursor)
+    #a resumed run finishes with the watermark the interrupted run started for. A newer one would
+    #also cover activity on businesses that run had already passed, and the resume skips those
+    if restart:
+        clear_checkpoints(cursor)
+    watermark, checkpoint_full = load_checkpoint_target(cursor)
+    if watermark is not None and full and not checkpoint_full:
+        #an incremental run's checkpoint says nothing about the untouched businesses before it
+        print("--full given, discarding the checkpoint of an interrupted incremental run")
+        clear_checkpoints(cursor)
+        watermark = None
+    if watermark is None:
+        #taken before reading metrics so anything arriving mid-run is picked up next time
+        watermark = current_watermark(cursor)
+    else:
+        print(f"resuming an interrupted run, watermark kept at {watermark[0]} / checkin {watermark[1]}")
+        if checkpoint_full and not full:
+            #finishing it incrementally would leave the untouched businesses past the checkpoint stale
+            print("the interrupted run was a full run, resuming it as one")
+            full = True
+    incremental = not full and previous_watermark is not None
+    if incremental:
+        touched = collect_touched_businesses(cursor, previous_watermark)
+        print(f"incremental run: {touched} businesses touched since {previous_watermark[0]} / checkin {previous_watermark[1]}")
+    else:
+        print("full run: recomputing every business")
+
+    errors = []
+    if workers > 1:
+        bounds = partition_bounds(cursor, partitions or workers, incremental)
+        print(f"parallel run: {len(bounds)} business_id ranges on {workers} workers")
+        count, elapsed, errors = run_parallel(workers, bounds, watermark, per_row=per_row, batch_size=batch_size,
+                                              incremental=incremental, restart=restart)
+    else:
+        after_id = None if restart else load_checkpoint(cursor)
+        if after_id is not None:
+            print(f"resuming after business {after_id}")
+
+        count, elapsed = run_pipeline(conn, watermark, per_row=per_row, batch_size=batch_size,
+                                      incremental=incremental, after_id=after_id)
+    mode = "per-row" if per_row else "bulk"
+    print(f"{mode} update: {count} rows in {elapsed:.2f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    if errors:
+        #leave the watermark alone so the failed partitions are redone next run
+        print(f"{len(errors)} partitions failed, watermark not advanced")
+    else:
+        save_watermark(cursor, watermark)
+        #serial and partition checkpoints alike, one left over from a differently shaped
+        #earlier run would otherwise make the next run skip businesses
+        clear_checkpoints(cursor)
+
+    rollups.refresh_zipcode_stats(conn)
+    rollups.bump_data_generation(conn)
+
+    snapshot_path = db.load_config()["snapshot_path"]
+    if snapshot_path and not errors:
+        #new or removed category rows can move businesses between lists, that needs a rebuild
+        snapshot.refresh(conn, snapshot_path, incremental=incremental and not (added or removed))
     
     cursor.close()
-    conn.close()
+    db.putconn(conn)
+    return not errors
 
 if __name__ == '__main__':
-    main()
-
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--per-row", action="store_true", help="use the old one UPDATE per business path")
+    parser.add_argument("--check", action="store_true", help="compare the metrics query with the old joined query and exit")
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and recompute every business")
+    parser.add_argument("--batch-size", type=int, default=10000, help="rows fetched, scored and committed per batch")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint left by an interrupted run")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, each with its own connection")
+    parser.add_argument("--partitions", type=int, default=None, help="business_id range partitions (default: --workers)")
+    args = parser.parse_args()
+    ok = main(per_row=args.per_row, check=args.check, full=args.full,
+              batch_size=args.batch_size, restart=args.restart,
+              workers=args.workers, partitions=args.partitions)
+    if ok is False:
+        raise SystemExit(1)
@@ -1,101 +1,41 @@
-import psycopg2
-import json
-import datetime
-from decimal import Decimal
-
-def connect_db():
-    try:
-        conn = psycopg2.connect(
-            dbname="milestone1db",
-            user="postgres",
-            password="admin",
-            host="localhost"
-        )
-        return conn
-    except Exception as e:
-        print(f"error: {e}")
-
-def get_states(conn):
-    with conn.cursor() as cur:
-        cur.execute("SELECT DISTINCT state FROM business ORDER BY state;")
-        states = cur.fetchall()
-        return states
-
-def get_cities(conn, selected_state):
-    with conn.cursor() as cur:
-        cur.execute("SELECT DISTINCT city FROM business WHERE state=%s ORDER BY city;", (selected_state,))
-        cities = cur.fetchall()
-        return cities
-
-def get_businesses(conn, selected_city, selected_state):
-    with conn.cursor() as cur:
-        cur.execute("SELECT name, city, state FROM business WHERE city=%s AND state=%s ORDER BY name;", (selected_city, selected_state))
-        businesses = cur.fetchall()
-        return businesses
-
-def get_zipcodes(conn, selected_city, selected_state):
-    with conn.cursor() as cur:
-        cur.execute("SELECT DISTINCT postal_code FROM businesses WHERE city=%s AND state=%s ORDER BY postal_code;", (selected_city, selected_state))
-        zipcodes = cur.fetchall()
-        return zipcodes
-
-def get_categories(conn, selected_zipcode):
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT DISTINCT UNNEST(string_to_array(categories, ', ')) AS category
-            FROM businesses
-            WHERE postal_code=%s
-            ORDER BY category;
-        """, (selected_zipcode,))
-        categories = cur.fetchall()
-        return categories
-
-def get_businesses_by_category(conn, selected_zipcode, selected_category):
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT name, city, state, stars, review_count, reviewrating, "numCheckins",
-            is_open, hours
-            FROM businesses
-            WHERE postal_code = %s AND categories LIKE %s
-            ORDER BY name;
-        """, (selected_zipcode, '%' + selected_category + '%',))
-        businesses = cur.fetchall()
-        return businesses
-    
-def calculate_success_score(last_review_date, avg_rating, numCheckins):
-    today_date = datetime.datetime.now().date()
-    days_since_last_review = (today_date - last_review_date).days
-    business_age_years = days_since_last_review / 365.25  
-
-    numCheckins = float(numCheckins)  
-    avg_rating = float(avg_rating)  
-
-    checkin_weight = 0.4
-    review_weight = 0.2
-    normalized_review_rating = avg_rating / 5
-
-    success_score = (checkin_weight * (numCheckins / max(numCheckins, 1))) + (review_weight * normalized_review_rating)
-    return success_score
-
-def calculate_popularity_score(numCheckins, review_count):
-    checkin_weight = 0.5
-    review_weight = 0.5
-    return (checkin_weight * numCheckins) + (review_weight * review_count)
+import db
+from finderqueries import (
+    get_states, get_cities, get_businesses, get_zipcodes, get_categories, get_businesses_by_category,
+    get_zipcode_stats, get_popular_businesses, get_successful_businesses, search_business_names,
+    get_search_bundle, SearchBundle, SEARCH_PAGE_SIZE, BUSINESSES_SQL, BUSINESSES_SORT_COLUMNS,
+    BUSINESSES_TIEBREAK, BUSINESSES_BY_CATEGORY_SQL, BUSINESSES_BY_CATEGORY_SORT_COLUMNS,
+    BUSINESSES_BY_CATEGORY_TIEBREAK,
+)
 
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QComboBox, QVBoxLayout, QHBoxLayout,
-    QWidget, QListWidget, QTableWidget, QTableWidgetItem, QLabel,
-    QPushButton, QGroupBox, QGridLayout, QMessageBox
+    QWidget, QListWidget, QTableWidget, QTableWidgetItem, QTableView, QLabel,
+    QPushButton, QGroupBox, QGridLayout, QMessageBox, QLineEdit
 )
 
+from PyQt5.QtCore import Qt, QTimer
+
+from queryworker import QueryRunner
+from businessmodel import BusinessTableModel, DeferredPagedCursor, open_paged_cursor
+
 class MyApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, snapshot=None):
         super().__init__()
-        self.conn = connect_db() 
+        #every query runs on a pooled connection in a worker thread, never on the event loop.
+        #with a snapshot loaded the same queries are answered from memory and the database is never touched
+        self.snapshot = snapshot
+        self.queries = QueryRunner(self)
+        self.queries.error.connect(self.on_query_error)
         self.setWindowTitle("Milestone 1")
         self.setGeometry(100, 100, 1400, 900)
         self.initUI()
 
+    def closeEvent(self, event):
+        self.queries.shutdown()
+        self.businessModel.clear()
+        db.close_pool()
+        super().closeEvent(event)
+
     def initUI(self):
         mainLayout = QVBoxLayout()
 
@@ -167,10 +107,14 @@ class MyApp(QMainWindow):
         filterLayout.addWidget(self.filterListWidget)
         filterGroupBox.setLayout(filterLayout)
 
-        self.businessTable = QTableWidget(0, 6)
-        self.businessTable.setHorizontalHeaderLabels([
+        self.businessTable = QTableView()
+        self.businessModel = BusinessTableModel([
             "Name", "City", "State", "Stars", "Review Count", "Review Rating"
-        ])
+        ], self, runner=self.queries, slot="business_page")
+        self.businessModel.sort_requested = self.on_business_sort
+        self.businessTable.setModel(self.businessModel)
+        self.businessTable.setSortingEnabled(True)
+        self.businessQuery = None
 
         self.businessTable.setColumnWidth(0, 280)  
         self.businessTable.setColumnWidth(1, 100) 
@@ -179,8 +123,21 @@ class MyApp(QMainWindow):
         self.businessTable.setColumnWidth(4, 85)   
         self.businessTable.setColumnWidth(5, 85)   
 
+        #one query per pause in typing, not one per keystroke
+        self.nameSearchEdit = QLineEdit()
+        self.nameSearchEdit.setPlaceholderText("Find a business by name (in the selected state / city)")
+        self.nameSearchTimer = QTimer(self)
+        self.nameSearchTimer.setSingleShot(True)
+        self.nameSearchTimer.setInterval(200)
+        self.nameSearchTimer.timeout.connect(self.on_name_search)
+        self.nameSearchEdit.textEdited.connect(lambda text: self.nameSearchTimer.start())
+
+        businessLayout = QVBoxLayout()
+        businessLayout.addWidget(self.nameSearchEdit)
+        businessLayout.addWidget(self.businessTable)
+
         secondRowLayout.addWidget(filterGroupBox)
-        secondRowLayout.addWidget(self.businessTable)
+        secondRowLayout.addLayout(businessLayout)
 
         mainLayout.addLayout(secondRowLayout)
         
@@ -192,10 +149,11 @@ class MyApp(QMainWindow):
 
         popularGroupBox = QGroupBox("Popular Businesses (in zipcode)")
         popularLayout = QVBoxLayout()
-        self.popularBusinessTable = QTableWidget(0, 4)  
-        self.popularBusinessTable.setHorizontalHeaderLabels([
+        self.popularBusinessTable = QTableView()
+        self.popularModel = BusinessTableModel([
             "Business Name", "Stars", "Review Count", "Popularity Score"
-        ])
+        ], self)
+        self.popularBusinessTable.setModel(self.popularModel)
         popularLayout.addWidget(self.popularBusinessTable)
         popularGroupBox.setLayout(popularLayout)
 
@@ -206,10 +164,11 @@ class MyApp(QMainWindow):
 
         successfulGroupBox = QGroupBox("Successful Businesses (in zipcode)")
         successfulLayout = QVBoxLayout()
-        self.successfulBusinessTable = QTableWidget(0, 4)  
-        self.successfulBusinessTable.setHorizontalHeaderLabels([
+        self.successfulBusinessTable = QTableView()
+        self.successfulModel = BusinessTableModel([
             "Business Name", "Review Count", "Number of Checkins", "Success Score"
-        ])
+        ], self)
+        self.successfulBusinessTable.setModel(self.successfulModel)
         successfulLayout.addWidget(self.successfulBusinessTable)
         successfulGroupBox.setLayout(successfulLayout)
 
@@ -230,30 +189,39 @@ class MyApp(QMainWindow):
 
         self.load_states()
 
+    def run_query(self, slot, fn, args, callback):
+        if self.snapshot is None:
+            self.queries.submit(slot, fn, args, callback)
+        else:
+            self.queries.submit(slot, getattr(self.snapshot, fn.__name__), args, callback, pooled=False)
+
+    def on_query_error(self, slot, message):
+        self.statusBar().showMessage(f"{slot} query failed: {message}", 10000)
+
     def load_states(self):
-        states = get_states(self.conn)
+        self.stateComboBox.activated[str].connect(self.on_state_changed) 
+        self.run_query("states", get_states, (), self.show_states)
+
+    def show_states(self, states):
         for state in states:
             self.stateComboBox.addItem(state[0])
-        self.stateComboBox.activated[str].connect(self.on_state_changed) 
 
 
     def on_state_changed(self, state):
+        #anything still loading for the previous state is now stale
+        self.queries.cancel()
         self.cityListWidget.clear()
         self.zipcodeListWidget.clear()
         self.filterListWidget.clear()
-        self.businessTable.setRowCount(0)
-        self.popularBusinessTable.setRowCount(0)
-        self.successfulBusinessTable.setRowCount(0)
+        self.clear_business_panels()
         self.categoriesTable.setRowCount(0)
         self.statsTable.setItem(0, 1, QTableWidgetItem("")) 
         self.statsTable.setItem(0, 2, QTableWidgetItem(""))  
         self.statsTable.setItem(0, 0, QTableWidgetItem(""))  
 
-        self.businessTable.setRowCount(0)
-        self.popularBusinessTable.setRowCount(0)
-        self.successfulBusinessTable.setRowCount(0)
+        self.run_query("cities", get_cities, (state,), self.show_cities)
 
-        cities = get_cities(self.conn, state)
+    def show_cities(self, cities):
         for city in cities:
             self.cityListWidget.addItem(city[0])
 
@@ -262,61 +230,97 @@ class MyApp(QMainWindow):
         if selected_items:
             selected_city = selected_items[0].text()
             state = self.stateComboBox.currentText()
-            zipcodes = get_zipcodes(self.conn, selected_city, state)
+            self.queries.cancel("zipcodes", "categories", "stats", "businesses", "popular", "successful",
+                                "search")
             self.zipcodeListWidget.clear()
             self.filterListWidget.clear()
-            self.businessTable.setRowCount(0)
-            self.popularBusinessTable.setRowCount(0)
-            self.successfulBusinessTable.setRowCount(0)
-            for zipcode in zipcodes:
-                self.zipcodeListWidget.addItem(zipcode[0])
+            self.clear_business_panels()
+            self.run_query("zipcodes", get_zipcodes, (selected_city, state), self.show_zipcodes)
+
+    def show_zipcodes(self, zipcodes):
+        for zipcode in zipcodes:
+            self.zipcodeListWidget.addItem(zipcode[0])
 
 
+    def clear_business_panels(self):
+        self.businessQuery = None
+        self.businessModel.clear()
+        self.popularModel.clear()
+        self.successfulModel.clear()
+
+    def open_business_query(self, sql, params, sort_columns, tiebreak, column=0, descending=False):
+        self.businessQuery = (sql, params, sort_columns, tiebreak)
+        if self.snapshot is not None:
+            fn = get_businesses if sql is BUSINESSES_SQL else get_businesses_by_category
+            self.run_query("businesses", fn, params, lambda rows: self.show_business_page((None, rows)))
+            return
+        #ties on the sort column fall back to name order, then to the key so paging by offset is stable
+        order_by = f"{sort_columns[column]} {'DESC' if descending else 'ASC'}, {sort_columns[0]}, {tiebreak}"
+        self.queries.submit("businesses", open_paged_cursor, (sql, params, order_by),
+                            self.show_business_page, pooled=False)
+
+    def show_business_page(self, result):
+        source, first_page = result
+        self.businessModel.set_source(source, first_page)
+
+    def on_business_sort(self, column, descending):
+        if self.businessQuery is None:
+            return
+        sql, params, sort_columns, tiebreak = self.businessQuery
+        if self.snapshot is not None:
+            self.businessModel.sort_rows(column, descending)
+        elif column < len(sort_columns):
+            self.open_business_query(sql, params, sort_columns, tiebreak, column, descending)
+
+    def reset_business_sort(self):
+        #with no query set the header's sort signal is a no-op, so this does not reload anything
+        self.businessQuery = None
+        self.businessTable.horizontalHeader().setSortIndicator(0, Qt.AscendingOrder)
+
     def load_businesses(self, city, state):
-        self.businessTable.setRowCount(0)
-        businesses = get_businesses(self.conn, city, state)
-        for business in businesses:
-            row_position = self.businessTable.rowCount()
-            self.businessTable.insertRow(row_position)
-            self.businessTable.setItem(row_position, 0, QTableWidgetItem(business[0]))
-            self.businessTable.setItem(row_position, 1, QTableWidgetItem(business[1]))
-            self.businessTable.setItem(row_position, 2, QTableWidgetItem(business[2]))
+        self.businessModel.clear()
+        self.reset_business_sort()
+        self.open_business_query(BUSINESSES_SQL, (city, state), BUSINESSES_SORT_COLUMNS, BUSINESSES_TIEBREAK)
+
+    def on_name_search(self):
+        text = self.nameSearchEdit.text().strip()
+        if not text:
+            return
+        state = self.stateComboBox.currentText() or None
+        city_item = self.cityListWidget.currentItem()
+        city = city_item.text() if city_item and state else None
+        self.run_query("businesses", search_business_names, (text, state, city), self.show_name_matches)
+
+    def show_name_matches(self, matches):
+        self.reset_business_sort()
+        self.businessModel.set_rows(matches)
 
     def on_zipcode_selected(self):
         selected_items = self.zipcodeListWidget.selectedItems()
         if selected_items:
             selected_zipcode = selected_items[0].text()
+            self.queries.cancel("businesses", "popular", "successful", "search")
             self.filterListWidget.clear()
-            self.businessTable.setRowCount(0)
-            self.popularBusinessTable.setRowCount(0)
-            self.successfulBusinessTable.setRowCount(0)
-            categories = get_categories(self.conn, selected_zipcode)
-            for category in categories:
-                self.filterListWidget.addItem(category[0])
+            self.clear_business_panels()
+            self.run_query("categories", get_categories, (selected_zipcode,), self.show_categories)
             self.update_zipcode_stats(selected_zipcode)
-            self.update_top_categories(selected_zipcode)
+
+    def show_categories(self, categories):
+        for category in categories:
+            self.filterListWidget.addItem(category[0])
 
 
     def on_category_selected(self):
         selected_items = self.filterListWidget.selectedItems()
         if selected_items:
             selected_category = selected_items[0].text()
-            self.businessTable.setRowCount(0)
-            self.popularBusinessTable.setRowCount(0)
-            self.successfulBusinessTable.setRowCount(0)
+            self.queries.cancel("businesses", "popular", "successful", "search")
+            self.clear_business_panels()
 
     def load_businesses_by_category(self, zipcode, category):
-        businesses = get_businesses_by_category(self.conn, zipcode, category)
-        self.businessTable.setRowCount(0)  
-        for business in businesses:
-            row_position = self.businessTable.rowCount()
-            self.businessTable.insertRow(row_position)
-            for i, property in enumerate(business):
-                if i == 7:  
-                    property = "Yes" if property else "No"
-                elif i == 8:  
-                    property = json.dumps(property) if isinstance(property, dict) else property
-                self.businessTable.setItem(row_position, i, QTableWidgetItem(str(property)))
+        self.reset_business_sort()
+        self.open_business_query(BUSINESSES_BY_CATEGORY_SQL, (zipcode, category),
+                                 BUSINESSES_BY_CATEGORY_SORT_COLUMNS, BUSINESSES_BY_CATEGORY_TIEBREAK)
 
     def on_search_clicked(self):
         if not all([self.stateComboBox.currentText(), self.cityListWidget.currentItem(), 
@@ -329,11 +333,23 @@ class MyApp(QMainWindow):
         zipcode = self.zipcodeListWidget.currentItem().text()
         category = self.filterListWidget.currentItem().text()
 
-        self.load_businesses_by_category(zipcode, category)
-        self.update_zipcode_stats(zipcode)
-        self.update_top_categories(zipcode)
-        self.update_popular_businesses(zipcode, category)
-        self.update_successful_businesses(zipcode, category)
+        self.queries.cancel("businesses", "stats", "popular", "successful")
+        self.run_query("search", get_search_bundle, (zipcode, category),
+                       lambda bundle: self.show_search_bundle(SearchBundle(*bundle), zipcode, category))
+
+    def show_search_bundle(self, bundle, zipcode, category):
+        self.reset_business_sort()
+        self.businessQuery = (BUSINESSES_BY_CATEGORY_SQL, (zipcode, category), BUSINESSES_BY_CATEGORY_SORT_COLUMNS,
+                              BUSINESSES_BY_CATEGORY_TIEBREAK)
+        source = None
+        if bundle.has_more_businesses:
+            source = DeferredPagedCursor(BUSINESSES_BY_CATEGORY_SQL, (zipcode, category),
+                                         f"b.name ASC, {BUSINESSES_BY_CATEGORY_TIEBREAK}",
+                                         SEARCH_PAGE_SIZE, offset=len(bundle.businesses))
+        self.businessModel.set_source(source, bundle.businesses)
+        self.show_zipcode_panels(bundle.stats)
+        self.show_popular_businesses(bundle.popular)
+        self.show_successful_businesses(bundle.successful)
 
     def on_refresh_clicked(self):
         zipcode_item = self.zipcodeListWidget.currentItem()
@@ -347,24 +363,24 @@ class MyApp(QMainWindow):
             QMessageBox.warning(self, "Selection Incomplete", "Please select both a zipcode and a category to refresh.")
     
     def update_zipcode_stats(self, zipcode):
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                SELECT COUNT(*) FROM businesses WHERE postal_code = %s;
-            """, (zipcode,))
-            business_count = cur.fetchone()[0]
-            self.statsTable.setItem(0, 0, QTableWidgetItem(str(business_count)))  
-
-            cur.execute("""
-                SELECT population, avg_income FROM zipcodes WHERE zip_code = %s;
-            """, (zipcode,))
-            result = cur.fetchone()
-            if result:
-                population, avg_income = result
-                self.statsTable.setItem(0, 1, QTableWidgetItem(str(population))) 
-                self.statsTable.setItem(0, 2, QTableWidgetItem(f"{avg_income:,.1f}")) 
-            else:
-                self.statsTable.setItem(0, 1, QTableWidgetItem("No data"))
-                self.statsTable.setItem(0, 2, QTableWidgetItem("No data"))
+        #one get_zipcode_stats call fills both the stats table and the top categories table
+        self.run_query("stats", get_zipcode_stats, (zipcode,), self.show_zipcode_panels)
+
+    def show_zipcode_panels(self, stats):
+        self.show_zipcode_stats(stats)
+        self.show_top_categories(stats)
+
+    def show_zipcode_stats(self, stats):
+        business_count = stats[0] if stats else 0
+        self.statsTable.setItem(0, 0, QTableWidgetItem(str(business_count)))  
+
+        if stats and stats[1] is not None:
+            population, avg_income = stats[1], stats[2]
+            self.statsTable.setItem(0, 1, QTableWidgetItem(str(population))) 
+            self.statsTable.setItem(0, 2, QTableWidgetItem(f"{avg_income:,.1f}")) 
+        else:
+            self.statsTable.setItem(0, 1, QTableWidgetItem("No data"))
+            self.statsTable.setItem(0, 2, QTableWidgetItem("No data"))
 
     def populate_business_table(self, table, business_data, headers):
         table.setRowCount(0)
@@ -379,87 +395,46 @@ class MyApp(QMainWindow):
   
     
     def update_popular_businesses(self, zipcode, category):
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                SELECT businesses.name, businesses.stars, businesses.review_count, businesses."numCheckins"
-                FROM businesses
-                WHERE businesses.postal_code = %s AND businesses.categories LIKE %s
-                ORDER BY businesses.review_count DESC, businesses."numCheckins" DESC
-                LIMIT 10;
-            """, (zipcode, '%' + category + '%',))
-            businesses = cur.fetchall()
-
-
-            popular_businesses = [
-                (
-                    business[0], 
-                    business[1], 
-                    business[2],  
-                    business[3], 
-                    calculate_popularity_score(business[3], business[2])  
-                )
-                for business in businesses
-            ]
-
-            self.popularBusinessTable.setRowCount(0)
-            for business in popular_businesses:
-                row_pos = self.popularBusinessTable.rowCount()
-                self.popularBusinessTable.insertRow(row_pos)
-                for i, item in enumerate(business):
-                    self.popularBusinessTable.setItem(row_pos, i, QTableWidgetItem(str(item)))
+        self.run_query("popular", get_popular_businesses, (zipcode, category), self.show_popular_businesses)
+
+    def show_popular_businesses(self, popular_businesses):
+        self.popularModel.set_rows([
+            (name, stars, review_count, "" if score is None else f"{score:.2f}")
+            for name, stars, review_count, numCheckins, score in popular_businesses
+        ])
 
 
     
 
     def update_successful_businesses(self, zipcode, category):
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                SELECT businesses.name, businesses.review_count, businesses."numCheckins", MAX(reviews.date) as last_review_date, AVG(reviews.stars) as avg_rating
-                FROM businesses
-                JOIN reviews ON reviews.business_id = businesses.business_id
-                WHERE businesses.postal_code = %s AND businesses.categories LIKE %s
-                GROUP BY businesses.name, businesses."numCheckins", businesses.review_count
-                ORDER BY businesses.review_count DESC, businesses."numCheckins" DESC
-                LIMIT 10;
-            """, (zipcode, '%' + category + '%',))
-            businesses = cur.fetchall()
-
-            successful_businesses = [
-                (
-                    business[0],  
-                    business[1],  
-                    business[2], 
-                    calculate_success_score(business[3], business[4], business[2])  # Success Score calculated in Python
-                )
-                for business in businesses
-            ]
-
-            self.successfulBusinessTable.setRowCount(0)
-            for business in successful_businesses:
-                row_pos = self.successfulBusinessTable.rowCount()
-                self.successfulBusinessTable.insertRow(row_pos)
-                self.successfulBusinessTable.setItem(row_pos, 0, QTableWidgetItem(str(business[0])))  
-                self.successfulBusinessTable.setItem(row_pos, 1, QTableWidgetItem(str(business[1])))  
-                self.successfulBusinessTable.setItem(row_pos, 2, QTableWidgetItem(str(business[2])))  
-                self.successfulBusinessTable.setItem(row_pos, 3, QTableWidgetItem(f"{business[3]:.2f}"))  
-
-    def update_top_categories(self, zipcode):
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                SELECT category, COUNT(*) FROM (
-                    SELECT UNNEST(string_to_array(categories, ', ')) AS category 
-                    FROM businesses WHERE postal_code = %s
-                ) AS cat GROUP BY category ORDER BY COUNT(*) DESC;
-            """, (zipcode,))
-            categories = cur.fetchall()
-            self.categoriesTable.setRowCount(len(categories))
-            for i, (category, count) in enumerate(categories):
-                self.categoriesTable.setItem(i, 0, QTableWidgetItem(category))
-                self.categoriesTable.setItem(i, 1, QTableWidgetItem(str(count)))
+        self.run_query("successful", get_successful_businesses, (zipcode, category), self.show_successful_businesses)
+
+    def show_successful_businesses(self, successful_businesses):
+        self.successfulModel.set_rows([
+            (name, review_count, numCheckins, "" if score is None else f"{score:.2f}")
+            for name, review_count, numCheckins, score in successful_businesses
+        ])
+
+    def show_top_categories(self, stats):
+        categories = stats[3] if stats else []
+        self.categoriesTable.setRowCount(len(categories))
+        for i, (category, count) in enumerate(categories):
+            self.categoriesTable.setItem(i, 0, QTableWidgetItem(category))
+            self.categoriesTable.setItem(i, 1, QTableWidgetItem(str(count)))
 
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="answer every query from a snapshot built by snapshot.py instead of the database")
+    args = parser.parse_args()
+    snapshot = None
+    if args.snapshot:
+        from snapshot import Snapshot
+        snapshot = Snapshot.load(args.snapshot)
+        print(f"snapshot: {snapshot.rows} businesses, built {snapshot.meta['built_at']}")
     app = QApplication([])
-    ex = MyApp()
+    ex = MyApp(snapshot)
     ex.show()
     app.exec_()
\ No newline at end of file
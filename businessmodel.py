@@ -0,0 +1,278 @@
+import json
+import itertools
+import threading
+
+import psycopg2
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+
+import db
+import queryworker
+
+_cursor_names = itertools.count(1)
+
+#an open paged cursor keeps a pooled connection idle in transaction, so it is parked (connection
+#returned, reopened at the same offset on the next scroll) once the view has been still this long
+PAGE_IDLE_MS = 30000
+
+class PagedCursor:
+    #server-side cursor on its own pooled connection, rows are pulled a page at a time as the view scrolls.
+    #fetch_page runs on a worker thread while close can come from the GUI thread: busy serializes the
+    #cursor I/O, lock guards the flags, and close aborts a fetch in flight instead of waiting it out
+    def __init__(self, sql, params, order_by, page_size=200, offset=0):
+        self.args = (sql, params, order_by, page_size)
+        self.page_size = page_size
+        self.offset = offset
+        self.exhausted = False
+        self.fetching = False
+        self.lock = threading.Lock()
+        self.busy = threading.Lock()
+        self.conn = db.getconn()
+        try:
+            self.cursor = self.conn.cursor(name=f"business_page_{next(_cursor_names)}")
+            self.cursor.itersize = page_size
+            with queryworker.watch(self):
+                with self.lock:
+                    self.fetching = True
+                try:
+                    self.cursor.execute(f"{sql} ORDER BY {order_by} OFFSET {int(offset)}", params)
+                finally:
+                    with self.lock:
+                        self.fetching = False
+        except Exception:
+            db.putconn(self.conn)
+            self.conn = None
+            raise
+
+    def fetch_page(self):
+        with self.busy:
+            with self.lock:
+                if self.exhausted:
+                    return []
+                self.fetching = True
+            try:
+                rows = self.cursor.fetchmany(self.page_size)
+            finally:
+                with self.lock:
+                    self.fetching = False
+            self.offset += len(rows)
+            if len(rows) < self.page_size:
+                self._release()
+            return rows
+
+    def _release(self):
+        #caller holds busy
+        self.exhausted = True
+        if self.conn is not None:
+            if not self.conn.closed:
+                try:
+                    self.cursor.close()
+                except psycopg2.Error:
+                    #the transaction was aborted by a cancel, putconn rolls it back
+                    pass
+            db.putconn(self.conn)
+            self.conn = None
+
+    def cancel(self):
+        #aborts the statement in flight, if any, the cursor stays usable only for close
+        with self.lock:
+            if self.fetching and self.conn is not None:
+                #the connection is still ours while fetching is set, so this cannot hit another query
+                self.conn.cancel()
+
+    def close(self):
+        with self.lock:
+            self.exhausted = True
+        self.cancel()
+        with self.busy:
+            self._release()
+
+    def park(self):
+        #gives the connection back and returns a source that reopens the cursor where this one stopped
+        parked = DeferredPagedCursor(*self.args, offset=self.offset)
+        parked.exhausted = self.exhausted
+        self.close()
+        return parked
+
+class DeferredPagedCursor:
+    #holds no connection until the view asks for more, then opens a PagedCursor past the rows
+    #already shown. Used for the search bundle's first page and for parked cursors
+    def __init__(self, sql, params, order_by, page_size=200, offset=0):
+        self.args = (sql, params, order_by, page_size, offset)
+        self.source = None
+        self.exhausted = False
+        self.lock = threading.Lock()
+
+    def fetch_page(self):
+        with self.lock:
+            if self.exhausted:
+                return []
+            source = self.source
+        if source is None:
+            source = PagedCursor(*self.args)
+            with self.lock:
+                closed = self.exhausted
+                if not closed:
+                    self.source = source
+            if closed:
+                source.close()
+                return []
+        rows = source.fetch_page()
+        with self.lock:
+            self.exhausted = self.exhausted or source.exhausted
+        return rows
+
+    def close(self):
+        with self.lock:
+            self.exhausted = True
+            source = self.source
+        if source is not None:
+            source.close()
+
+    def park(self):
+        with self.lock:
+            source = self.source
+        if source is None:
+            return self
+        self.exhausted = True
+        return source.park()
+
+def fetch_page(source):
+    #runs on a worker thread, the source travels with its rows so stale pages can be told apart
+    return source, source.fetch_page()
+
+def open_paged_cursor(sql, params, order_by, page_size=200):
+    #runs on a worker thread, hands back the cursor together with its first page. The first fetch
+    #is where the server sorts, a stale query is cancelled there instead of holding its connection
+    source = PagedCursor(sql, params, order_by, page_size)
+    try:
+        with queryworker.watch(source):
+            rows = source.fetch_page()
+    except Exception:
+        source.close()
+        raise
+    return source, rows
+
+def format_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return str(value)
+
+class BusinessTableModel(QAbstractTableModel):
+    #rows live in one list per column, only the columns the view shows are kept. With a runner,
+    #further pages are fetched through it in the given slot so scrolling never blocks the GUI thread
+    def __init__(self, headers, parent=None, runner=None, slot=None):
+        super().__init__(parent)
+        self.headers = headers
+        self.columns = [[] for _ in headers]
+        self.row_count = 0
+        self.source = None
+        self.sort_requested = None
+        self.runner = runner
+        self.slot = slot
+        self.fetching = False
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(PAGE_IDLE_MS)
+        self.idle_timer.timeout.connect(self._park_source)
+
+    def _append(self, rows):
+        for column_index, column in enumerate(self.columns):
+            column.extend(row[column_index] if column_index < len(row) else None for row in rows)
+        self.row_count += len(rows)
+
+    def _close_source(self):
+        self.idle_timer.stop()
+        if self.fetching:
+            self.runner.cancel(self.slot)
+            self.fetching = False
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+    def _park_source(self):
+        if self.source is not None and not self.fetching and not self.source.exhausted:
+            self.source = self.source.park()
+
+    def set_source(self, source, first_page):
+        self.beginResetModel()
+        self._close_source()
+        self.columns = [[] for _ in self.headers]
+        self.row_count = 0
+        self.source = source
+        self._append(first_page)
+        self.endResetModel()
+        if source is not None:
+            self.idle_timer.start()
+
+    def set_rows(self, rows):
+        self.set_source(None, rows)
+
+    def clear(self):
+        self.set_source(None, [])
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return format_value(self.columns[index.column()][index.row()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.source is not None and not self.source.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent) or self.fetching:
+            return
+        if self.runner is None:
+            self._insert_page((self.source, self.source.fetch_page()))
+            return
+        self.fetching = True
+        self.runner.submit(self.slot, fetch_page, (self.source,), self._insert_page, pooled=False,
+                           errback=self._page_failed)
+
+    def _insert_page(self, result):
+        source, rows = result
+        if source is not self.source:
+            return
+        self.fetching = False
+        if rows:
+            self.beginInsertRows(QModelIndex(), self.row_count, self.row_count + len(rows) - 1)
+            self._append(rows)
+            self.endInsertRows()
+        if not source.exhausted:
+            self.idle_timer.start()
+
+    def _page_failed(self, message):
+        #the error itself is reported by the runner, stop paging this result
+        self.fetching = False
+        self._close_source()
+
+    def sort_rows(self, column, descending=False):
+        #in-memory sort for models holding every row, empty values go last either way
+        if self.source is not None or column >= len(self.columns):
+            return
+        values = self.columns[column]
+        present = sorted((i for i in range(self.row_count) if values[i] is not None),
+                         key=values.__getitem__, reverse=descending)
+        order = present + [i for i in range(self.row_count) if values[i] is None]
+        self.beginResetModel()
+        self.columns = [[column_values[i] for i in order] for column_values in self.columns]
+        self.endResetModel()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        #sorting is done by the database, the owner reopens the cursor with a new ORDER BY
+        if self.sort_requested is not None:
+            self.sort_requested(column, order == Qt.DescendingOrder)
@@ -0,0 +1,82 @@
+import os
+import json
+import time
+import requests
+
+CACHE_DIR = os.environ.get("YELPSIM_CACHE_DIR", ".census_cache")
+DEFAULT_TTL = 24 * 60 * 60
+
+class OfflineCacheMiss(Exception):
+    pass
+
+def _paths(cache_dir, name):
+    return os.path.join(cache_dir, f"{name}.json"), os.path.join(cache_dir, f"{name}.meta.json")
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_file(path, data):
+    #write to a temp file first so a killed run never leaves a half-written cache entry
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _load_body(body_path):
+    with open(body_path, "rb") as f:
+        return json.load(f)
+
+def fetch_json(name, url, cache_dir=CACHE_DIR, ttl=DEFAULT_TTL, offline=False, timeout=60):
+    body_path, meta_path = _paths(cache_dir, name)
+    meta = _read_meta(meta_path)
+    cached = os.path.exists(body_path)
+
+    #offline replays whatever is on disk, cached responses and fixture files look the same
+    if offline:
+        if not cached:
+            raise OfflineCacheMiss(f"no cached response for {name} in {cache_dir}")
+        return _load_body(body_path)
+
+    same_url = meta.get("url") == url
+    if cached and same_url and time.time() - meta.get("fetched_at", 0) < ttl:
+        return _load_body(body_path)
+
+    headers = {}
+    if cached and same_url:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        response = requests.get(url, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        if cached:
+            print(f"{name}: request failed ({e}), using cached response")
+            return _load_body(body_path)
+        raise
+
+    if response.status_code == 304 and cached:
+        meta["fetched_at"] = time.time()
+        _write_file(meta_path, json.dumps(meta).encode())
+        return _load_body(body_path)
+
+    if response.status_code != 200:
+        if cached:
+            print(f"{name}: HTTP {response.status_code}, using cached response")
+            return _load_body(body_path)
+        return None
+
+    _write_file(body_path, response.content)
+    _write_file(meta_path, json.dumps({
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "fetched_at": time.time(),
+    }).encode())
+    return response.json()
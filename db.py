@@ -0,0 +1,112 @@
+import os
+import configparser
+import contextlib
+import psycopg2
+import psycopg2.pool
+
+import instrument
+from statements import registry as statements
+
+#settings come from these defaults, then the [database] section of the config file,
+#then YELPSIM_<KEY> environment variables (e.g. YELPSIM_HOST, YELPSIM_POOL_MAX)
+DEFAULTS = {
+    "dbname": "milestone1db",
+    "user": "postgres",
+    "password": "admin",
+    "host": "localhost",
+    "port": "5432",
+    "pool_min": "1",
+    "pool_max": "10",
+    "statement_timeout": "0",
+    "application_name": "yelpsim",
+    #instrumentation, off unless metrics_file or metrics_port is set. metrics_file may
+    #contain {pid} so parallel import workers each write their own file
+    "metrics_file": "",
+    "metrics_port": "0",
+    "slow_query_ms": "500",
+    "slow_query_log": "slow_queries.log",
+    #when set, business_import keeps a finder snapshot at this path up to date
+    "snapshot_path": "",
+}
+
+CONFIG_PATH = os.environ.get("YELPSIM_CONFIG", "yelpsim.ini")
+
+_pool = None
+_pool_pid = None
+
+def load_config(path=CONFIG_PATH):
+    config = dict(DEFAULTS)
+    parser = configparser.ConfigParser()
+    if parser.read(path) and parser.has_section("database"):
+        config.update(parser["database"])
+    for key in DEFAULTS:
+        value = os.environ.get(f"YELPSIM_{key.upper()}")
+        if value is not None:
+            config[key] = value
+    return config
+
+def connect_kwargs(config=None, application_name=None):
+    config = config or load_config()
+    kwargs = {
+        "dbname": config["dbname"],
+        "user": config["user"],
+        "password": config["password"],
+        "host": config["host"],
+        "port": config["port"],
+        "application_name": application_name or config["application_name"],
+        #milliseconds, 0 disables the timeout
+        "options": f"-c statement_timeout={int(config['statement_timeout'])}",
+    }
+    cursor_factory = instrument.configure(config)
+    if cursor_factory is not None:
+        kwargs["cursor_factory"] = cursor_factory
+    return kwargs
+
+def connect_db(application_name=None):
+    #a dedicated connection outside the pool, for long-lived work like the import job
+    return psycopg2.connect(**connect_kwargs(application_name=application_name))
+
+def get_pool():
+    global _pool, _pool_pid
+    #a pool inherited over fork shares sockets with the parent, so each process builds its own
+    if _pool is None or _pool_pid != os.getpid():
+        config = load_config()
+        _pool = psycopg2.pool.ThreadedConnectionPool(
+            int(config["pool_min"]), int(config["pool_max"]), **connect_kwargs(config)
+        )
+        _pool_pid = os.getpid()
+    return _pool
+
+def getconn():
+    return get_pool().getconn()
+
+def putconn(conn):
+    pool = get_pool()
+    if conn.closed:
+        pool.putconn(conn, close=True)
+        statements.forget(conn)
+        return
+    #never hand the next borrower a connection stuck in a transaction
+    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+    pool.putconn(conn)
+    if conn.closed:
+        #the pool closes connections it has no room to keep, their prepared statements go with them
+        statements.forget(conn)
+
+@contextlib.contextmanager
+def connection():
+    conn = getconn()
+    try:
+        yield conn
+    finally:
+        putconn(conn)
+
+def close_pool():
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        for conn in list(_pool._pool) + list(_pool._used.values()):
+            statements.forget(conn)
+        _pool.closeall()
+    _pool = None
+    _pool_pid = None
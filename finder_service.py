@@ -0,0 +1,288 @@
+import json
+import asyncio
+import threading
+import argparse
+import datetime
+import concurrent.futures
+from decimal import Decimal
+from urllib.parse import urlsplit, parse_qs
+
+import psycopg2
+import psycopg2.pool
+
+import db
+import finderqueries
+from statements import registry as statements
+
+#headless JSON API over the finder queries. The queries are the same psycopg2 functions the GUI
+#uses (prepared statements, query cache), run on a thread pool no bigger than the connection pool
+#so asyncio never waits on a free connection inside a worker thread
+
+#path -> (query function, query parameters in call order, names of the result columns).
+#a list of names means a list of rows, a tuple means a single row or null
+ENDPOINTS = {
+    "/states": (finderqueries.get_states, [], ["state"]),
+    "/cities": (finderqueries.get_cities, ["state"], ["city"]),
+    "/zipcodes": (finderqueries.get_zipcodes, ["city", "state"], ["zipcode"]),
+    "/categories": (finderqueries.get_categories, ["zipcode"], ["category"]),
+    "/businesses": (finderqueries.get_businesses_by_category, ["zipcode", "category"],
+                    ["name", "city", "state", "stars", "review_count", "reviewrating", "numCheckins", "is_open", "hours"]),
+    "/search": (finderqueries.search_business_names, ["q", "state?", "city?"],
+                ["name", "city", "state", "stars", "review_count", "reviewrating"]),
+    "/stats": (finderqueries.get_zipcode_stats, ["zipcode"],
+               ("business_count", "population", "avg_income", "top_categories")),
+    "/popular": (finderqueries.get_popular_businesses, ["zipcode", "category"],
+                 ["name", "stars", "review_count", "numCheckins", "popularity_score"]),
+    "/successful": (finderqueries.get_successful_businesses, ["zipcode", "category"],
+                    ["name", "review_count", "numCheckins", "success_score"]),
+}
+
+#/nearby is answered from a snapshot (see snapshot.py) with its in-memory spatial index
+NEARBY_COLUMNS = ["name", "city", "state", "zipcode", "stars", "review_count", "popularity_score",
+                  "success_score", "distance_km"]
+NEARBY_RANKINGS = ("distance", "popularity", "success")
+NEARBY_MAX_K = 1000
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+class BadRequest(Exception):
+    pass
+
+def to_json(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def shape(result, columns):
+    if isinstance(columns, tuple):
+        return None if result is None else dict(zip(columns, result))
+    return [dict(zip(columns, row)) for row in result]
+
+class InFlight:
+    #one running query shared by every request asking for the same thing
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+        #conn is only set while the query owns it, lock keeps a cancel from landing after putconn
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            if self.conn is not None and not self.conn.closed:
+                self.conn.cancel()
+
+class FinderService:
+    def __init__(self, timeout=5.0, workers=None, snapshot=None):
+        config = db.load_config()
+        self.timeout = timeout
+        self.snapshot = snapshot
+        #more threads than pooled connections would make getconn raise under load
+        self.workers = min(workers or int(config["pool_max"]), int(config["pool_max"]))
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        self.in_flight = {}
+        self.counters = {"requests": 0, "queries": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    def _run_query(self, call, fn, args):
+        conn = db.getconn()
+        with call.lock:
+            call.conn = conn
+        try:
+            return fn(conn, *args)
+        finally:
+            with call.lock:
+                call.conn = None
+            db.putconn(conn)
+
+    def _finished(self, key, task):
+        self.in_flight.pop(key, None)
+        if not task.cancelled():
+            #marks the error as seen when every waiter already timed out
+            task.exception()
+
+    async def query(self, path, args):
+        key = (path,) + args
+        call = self.in_flight.get(key)
+        if call is None:
+            fn = ENDPOINTS[path][0]
+            loop = asyncio.get_running_loop()
+            call = InFlight(None)
+            call.task = loop.run_in_executor(self.executor, self._run_query, call, fn, args)
+            call.task.add_done_callback(lambda task: self._finished(key, task))
+            self.in_flight[key] = call
+            self.counters["queries"] += 1
+        else:
+            self.counters["coalesced"] += 1
+        call.waiters += 1
+        try:
+            #shielded so one client's timeout does not cancel the query for the others waiting on it
+            return await asyncio.wait_for(asyncio.shield(call.task), self.timeout)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            if call.waiters == 1:
+                #nobody else wants the answer, stop the backend instead of letting it finish
+                call.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def parse_args(self, path, query):
+        params = parse_qs(query)
+        args = []
+        for name in ENDPOINTS[path][1]:
+            optional = name.endswith("?")
+            name = name.rstrip("?")
+            value = params.get(name, [None])[0]
+            if value is None and not optional:
+                raise BadRequest(f"missing parameter: {name}")
+            args.append(value)
+        return tuple(args)
+
+    def parse_nearby(self, query):
+        params = {name: values[0] for name, values in parse_qs(query).items()}
+        try:
+            if "business_id" in params:
+                location = self.snapshot.location_of(params["business_id"])
+                if location is None or None in location:
+                    raise BadRequest(f"no location for business {params['business_id']}")
+                latitude, longitude = location
+            else:
+                latitude, longitude = float(params["lat"]), float(params["lon"])
+            k = int(params.get("k", 10))
+            radius_km = float(params["radius_km"]) if "radius_km" in params else None
+        except KeyError as e:
+            raise BadRequest(f"missing parameter: {e.args[0]} (or business_id)")
+        except ValueError as e:
+            raise BadRequest(str(e))
+        rank_by = params.get("rank_by", "distance")
+        if rank_by not in NEARBY_RANKINGS:
+            raise BadRequest(f"rank_by must be one of {', '.join(NEARBY_RANKINGS)}")
+        if not 1 <= k <= NEARBY_MAX_K or (radius_km is not None and radius_km <= 0):
+            raise BadRequest(f"k must be 1..{NEARBY_MAX_K} and radius_km positive")
+        return latitude, longitude, k, radius_km, params.get("category"), rank_by
+
+    async def nearby(self, query):
+        if self.snapshot is None:
+            return 404, {"error": "/nearby needs the service started with --snapshot"}
+        try:
+            args = self.parse_nearby(query)
+        except BadRequest as e:
+            return 400, {"error": str(e)}
+        loop = asyncio.get_running_loop()
+        try:
+            rows = await asyncio.wait_for(loop.run_in_executor(None, self.snapshot.nearby_businesses, *args),
+                                          self.timeout)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            return 504, {"error": f"query did not finish in {self.timeout}s"}
+        return 200, shape(rows, NEARBY_COLUMNS)
+
+    def _statement_stats(self):
+        #plan counts come from pg_prepared_statements, which is per connection, so they are for
+        #whichever pooled connection this runs on; the execution counters cover the whole process
+        with db.connection() as conn:
+            return statements.stats(conn)
+
+    async def statement_stats(self):
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(self.executor, self._statement_stats), self.timeout)
+
+    async def handle(self, method, target):
+        self.counters["requests"] += 1
+        url = urlsplit(target)
+        if method != "GET":
+            return 405, {"error": "only GET is supported"}
+        if url.path == "/health":
+            return 200, dict(self.counters, in_flight=len(self.in_flight))
+        if url.path == "/nearby":
+            return await self.nearby(url.query)
+        if url.path not in ENDPOINTS and url.path != "/statements":
+            return 404, {"error": f"unknown endpoint {url.path}", "endpoints": sorted(ENDPOINTS)}
+        try:
+            if url.path == "/statements":
+                return 200, await self.statement_stats()
+            args = self.parse_args(url.path, url.query)
+            result = await self.query(url.path, args)
+        except BadRequest as e:
+            return 400, {"error": str(e)}
+        except asyncio.TimeoutError:
+            return 504, {"error": f"query did not finish in {self.timeout}s"}
+        except psycopg2.pool.PoolError as e:
+            self.counters["errors"] += 1
+            return 503, {"error": str(e)}
+        except psycopg2.Error as e:
+            self.counters["errors"] += 1
+            return 500, {"error": str(e).strip()}
+        return 200, shape(result, ENDPOINTS[url.path][2])
+
+    async def serve_connection(self, reader, writer):
+        #minimal HTTP/1.1: GET requests, no bodies, keep-alive unless the client asks to close
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                status, payload = await self.handle(method, target)
+                body = json.dumps(payload, default=to_json).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def run(self, host, port):
+        server = await asyncio.start_server(self.serve_connection, host, port, backlog=1024)
+        print(f"finder service on http://{host}:{port} ({self.workers} query threads, "
+              f"{self.timeout}s timeout)")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        db.close_pool()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the finder queries as a JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds before a request gets a 504")
+    parser.add_argument("--workers", type=int, help="query threads, at most pool_max (default pool_max)")
+    parser.add_argument("--snapshot", metavar="PATH", help="snapshot built by snapshot.py, enables /nearby")
+    args = parser.parse_args()
+    snapshot = None
+    if args.snapshot:
+        from snapshot import Snapshot
+        snapshot = Snapshot.load(args.snapshot)
+        #built up front so the first /nearby request does not pay for it
+        snapshot.spatial_index()
+    service = FinderService(timeout=args.timeout, workers=args.workers, snapshot=snapshot)
+    try:
+        asyncio.run(service.run(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
@@ -0,0 +1,237 @@
+from collections import namedtuple
+
+from querycache import QueryCache
+from statements import registry as statements
+
+#location hierarchy and category lists only change when an import runs
+query_cache = QueryCache()
+
+#every hot finder query is prepared once per pooled connection and run with EXECUTE
+statements.register("get_states", "SELECT DISTINCT state FROM business ORDER BY state;")
+
+@query_cache.cached
+def get_states(conn):
+    with conn.cursor() as cur:
+        statements.execute(cur, "get_states")
+        states = cur.fetchall()
+        return states
+
+statements.register("get_cities", "SELECT DISTINCT city FROM business WHERE state=%s ORDER BY city;")
+
+@query_cache.cached
+def get_cities(conn, selected_state):
+    with conn.cursor() as cur:
+        statements.execute(cur, "get_cities", (selected_state,))
+        cities = cur.fetchall()
+        return cities
+
+BUSINESSES_SQL = "SELECT name, city, state FROM business WHERE city=%s AND state=%s"
+BUSINESSES_SORT_COLUMNS = ["name", "city", "state"]
+#last ORDER BY term, makes the order total so a cursor reopened at an offset neither repeats nor skips rows
+BUSINESSES_TIEBREAK = "business_id"
+
+statements.register("get_businesses", BUSINESSES_SQL + " ORDER BY name, business_id;")
+
+def get_businesses(conn, selected_city, selected_state):
+    with conn.cursor() as cur:
+        statements.execute(cur, "get_businesses", (selected_city, selected_state))
+        businesses = cur.fetchall()
+        return businesses
+
+statements.register("get_zipcodes", "SELECT DISTINCT postal_code FROM businesses WHERE city=%s AND state=%s ORDER BY postal_code;")
+
+@query_cache.cached
+def get_zipcodes(conn, selected_city, selected_state):
+    with conn.cursor() as cur:
+        statements.execute(cur, "get_zipcodes", (selected_city, selected_state))
+        zipcodes = cur.fetchall()
+        return zipcodes
+
+statements.register("get_categories", """
+    SELECT DISTINCT category
+    FROM business_categories
+    WHERE postal_code=%s
+    ORDER BY category;
+""")
+
+@query_cache.cached
+def get_categories(conn, selected_zipcode):
+    with conn.cursor() as cur:
+        statements.execute(cur, "get_categories", (selected_zipcode,))
+        categories = cur.fetchall()
+        return categories
+
+BUSINESSES_BY_CATEGORY_SQL = """
+    SELECT b.name, b.city, b.state, b.stars, b.review_count, b.reviewrating, b."numCheckins",
+    b.is_open, b.hours
+    FROM business_categories bc
+    JOIN businesses b ON b.business_id = bc.business_id
+    WHERE bc.postal_code = %s AND bc.category = %s
+"""
+#ORDER BY expression for each column shown in the business table
+BUSINESSES_BY_CATEGORY_SORT_COLUMNS = ["b.name", "b.city", "b.state", "b.stars", "b.review_count", "b.reviewrating"]
+BUSINESSES_BY_CATEGORY_TIEBREAK = "b.business_id"
+
+statements.register("get_businesses_by_category", BUSINESSES_BY_CATEGORY_SQL + " ORDER BY b.name, b.business_id;")
+
+def get_businesses_by_category(conn, selected_zipcode, selected_category):
+    with conn.cursor() as cur:
+        statements.execute(cur, "get_businesses_by_category", (selected_zipcode, selected_category))
+        businesses = cur.fetchall()
+        return businesses
+
+statements.register("get_zipcode_stats", """
+    SELECT business_count, population, avg_income, top_categories
+    FROM zipcode_stats
+    WHERE zip_code = %s;
+""")
+
+def get_zipcode_stats(conn, selected_zipcode):
+    #business_count, population, avg_income, [[category, count], ...] from the zipcode_stats rollup
+    with conn.cursor() as cur:
+        statements.execute(cur, "get_zipcode_stats", (selected_zipcode,))
+        return cur.fetchone()
+
+#popularity_score and success_score are stored on businesses by business_import, and each panel
+#walks the (postal_code, score DESC) index from business_import.RANKING_INDEXES, probing the
+#category mapping per row, so the true top N by score stops after N matches
+statements.register("get_popular_businesses", """
+    SELECT b.name, b.stars, b.review_count, b."numCheckins", b.popularity_score
+    FROM businesses b
+    WHERE b.postal_code = %s
+    AND EXISTS (
+        SELECT 1 FROM business_categories bc
+        WHERE bc.business_id = b.business_id AND bc.category = %s
+    )
+    ORDER BY b.popularity_score DESC NULLS LAST
+    LIMIT 10;
+""")
+
+def get_popular_businesses(conn, zipcode, category):
+    with conn.cursor() as cur:
+        statements.execute(cur, "get_popular_businesses", (zipcode, category))
+        return cur.fetchall()
+
+statements.register("get_successful_businesses", """
+    SELECT b.name, b.review_count, b."numCheckins", b.success_score
+    FROM businesses b
+    WHERE b.postal_code = %s
+    AND EXISTS (
+        SELECT 1 FROM business_categories bc
+        WHERE bc.business_id = b.business_id AND bc.category = %s
+    )
+    ORDER BY b.success_score DESC NULLS LAST
+    LIMIT 10;
+""")
+
+def get_successful_businesses(conn, zipcode, category):
+    with conn.cursor() as cur:
+        statements.execute(cur, "get_successful_businesses", (zipcode, category))
+        return cur.fetchall()
+
+#type-ahead name search. Three characters and up match anywhere in the name through the trigram
+#index and come back closest first, shorter input is a prefix match on lower(name)
+NAME_SEARCH_LIMIT = 25
+NAME_SEARCH_MIN_TRIGRAM = 3
+NAME_SEARCH_COLUMNS = "name, city, state, stars, review_count, reviewrating"
+NAME_SEARCH_SCOPES = {
+    "all": "",
+    "state": " AND state = %s",
+    "city": " AND state = %s AND city = %s",
+}
+
+for scope, condition in NAME_SEARCH_SCOPES.items():
+    statements.register(f"search_names_prefix_{scope}", f"""
+        SELECT {NAME_SEARCH_COLUMNS} FROM businesses
+        WHERE lower(name) COLLATE "C" LIKE %s{condition}
+        ORDER BY lower(name) COLLATE "C", business_id
+        LIMIT %s;
+    """)
+    statements.register(f"search_names_trigram_{scope}", f"""
+        SELECT {NAME_SEARCH_COLUMNS} FROM businesses
+        WHERE name ILIKE %s{condition}
+        ORDER BY name <-> %s, business_id
+        LIMIT %s;
+    """)
+
+def like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_business_names(conn, text, state=None, city=None, limit=NAME_SEARCH_LIMIT):
+    text = text.strip()
+    if not text:
+        return []
+    if state and city:
+        scope, scope_params = "city", (state, city)
+    elif state:
+        scope, scope_params = "state", (state,)
+    else:
+        scope, scope_params = "all", ()
+    with conn.cursor() as cur:
+        if len(text) < NAME_SEARCH_MIN_TRIGRAM:
+            statements.execute(cur, f"search_names_prefix_{scope}",
+                               (like_escape(text.lower()) + "%",) + scope_params + (limit,))
+        else:
+            statements.execute(cur, f"search_names_trigram_{scope}",
+                               ("%" + like_escape(text) + "%",) + scope_params + (text, limit))
+        return cur.fetchall()
+
+#everything the panels show after Search, fetched in one statement and one round trip.
+#businesses is the first page of the business list, has_more_businesses says if paging continues
+SearchBundle = namedtuple("SearchBundle", [
+    "businesses", "has_more_businesses", "stats", "popular", "successful",
+])
+
+SEARCH_PAGE_SIZE = 200
+
+statements.register("get_search_bundle", """
+    SELECT
+        (SELECT COALESCE(json_agg(json_build_array(page.name, page.city, page.state, page.stars,
+                                                   page.review_count, page.reviewrating, page."numCheckins",
+                                                   page.is_open, page.hours) ORDER BY page.name, page.business_id), '[]'::json)
+         FROM (
+             SELECT b.business_id, b.name, b.city, b.state, b.stars, b.review_count, b.reviewrating,
+                    b."numCheckins", b.is_open, b.hours
+             FROM business_categories bc
+             JOIN businesses b ON b.business_id = bc.business_id
+             WHERE bc.postal_code = %s AND bc.category = %s
+             ORDER BY b.name, b.business_id
+             LIMIT %s
+         ) page) AS businesses,
+        (SELECT json_build_array(business_count, population, avg_income, top_categories)
+         FROM zipcode_stats WHERE zip_code = %s) AS stats,
+        (SELECT COALESCE(json_agg(json_build_array(top.name, top.stars, top.review_count, top."numCheckins",
+                                                   top.popularity_score) ORDER BY top.popularity_score DESC NULLS LAST), '[]'::json)
+         FROM (
+             SELECT b.name, b.stars, b.review_count, b."numCheckins", b.popularity_score
+             FROM businesses b
+             WHERE b.postal_code = %s
+             AND EXISTS (SELECT 1 FROM business_categories bc WHERE bc.business_id = b.business_id AND bc.category = %s)
+             ORDER BY b.popularity_score DESC NULLS LAST
+             LIMIT 10
+         ) top) AS popular,
+        (SELECT COALESCE(json_agg(json_build_array(top.name, top.review_count, top."numCheckins",
+                                                   top.success_score) ORDER BY top.success_score DESC NULLS LAST), '[]'::json)
+         FROM (
+             SELECT b.name, b.review_count, b."numCheckins", b.success_score
+             FROM businesses b
+             WHERE b.postal_code = %s
+             AND EXISTS (SELECT 1 FROM business_categories bc WHERE bc.business_id = b.business_id AND bc.category = %s)
+             ORDER BY b.success_score DESC NULLS LAST
+             LIMIT 10
+         ) top) AS successful;
+""")
+
+def get_search_bundle(conn, zipcode, category, page_size=SEARCH_PAGE_SIZE):
+    with conn.cursor() as cur:
+        #one row past the page tells us whether the business list continues
+        statements.execute(cur, "get_search_bundle", (zipcode, category, page_size + 1, zipcode,
+                                                      zipcode, category, zipcode, category))
+        businesses, stats, popular, successful = cur.fetchone()
+    return SearchBundle(
+        businesses=[tuple(row) for row in businesses[:page_size]],
+        has_more_businesses=len(businesses) > page_size,
+        stats=tuple(stats) if stats else None,
+        popular=[tuple(row) for row in popular],
+        successful=[tuple(row) for row in successful],
+    )
@@ -0,0 +1,198 @@
+import time
+import argparse
+import datetime
+import numpy as np
+
+import db
+import bulkload
+
+#a synthetic dataset shaped like the Yelp tables the finder and importer use. Everything is
+#drawn from one seeded generator so the same --businesses/--seed always gives the same rows
+
+CATEGORIES = [
+    "Restaurants", "Food", "Shopping", "Nightlife", "Bars", "Beauty & Spas", "Health & Medical",
+    "Home Services", "Automotive", "Local Services", "Event Planning & Services", "Active Life",
+    "Coffee & Tea", "Fast Food", "Pizza", "Sandwiches", "Mexican", "American (Traditional)",
+    "Italian", "Chinese", "Breakfast & Brunch", "Hotels & Travel", "Arts & Entertainment",
+    "Sports Bars", "Burgers", "Japanese", "Sushi Bars", "Bakeries", "Desserts", "Pets",
+    "Fitness & Instruction", "Hair Salons", "Nail Salons", "Auto Repair", "Grocery",
+    "Specialty Food", "Seafood", "Thai", "Vietnamese", "Indian", "Mediterranean", "Wine Bars",
+    "Cocktail Bars", "Pubs", "Delis", "Salad", "Chicken Wings", "Steakhouses", "Barbeque", "Vegan",
+]
+
+STATES = ["AZ", "NV", "PA", "OH", "NC", "WI", "IL", "FL", "TN", "IN", "MO", "LA", "CA", "NJ", "ID"]
+
+SCHEMA = [
+    "DROP VIEW IF EXISTS business;",
+    "DROP TABLE IF EXISTS Reviews, CheckIns, business_categories, Businesses, Zipcodes CASCADE;",
+    #importer state describes the old rows, left behind it would make the next import incremental
+    "DROP TABLE IF EXISTS import_watermark, import_checkpoint, touched_businesses;",
+    """CREATE TABLE Businesses (
+        business_id VARCHAR PRIMARY KEY,
+        name VARCHAR,
+        city VARCHAR,
+        state VARCHAR(2),
+        postal_code VARCHAR(5),
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        stars NUMERIC(2, 1),
+        review_count INT,
+        reviewrating NUMERIC(3, 2),
+        "numCheckins" INT,
+        is_open BOOLEAN,
+        hours JSONB,
+        categories VARCHAR,
+        popularity_score DOUBLE PRECISION,
+        success_score DOUBLE PRECISION
+    );""",
+    "CREATE VIEW business AS SELECT business_id, name, city, state, postal_code FROM Businesses;",
+    """CREATE TABLE Reviews (
+        review_id BIGINT PRIMARY KEY,
+        business_id VARCHAR,
+        user_id VARCHAR,
+        stars INT,
+        date TIMESTAMP
+    );""",
+    """CREATE TABLE CheckIns (
+        checkin_id BIGINT PRIMARY KEY,
+        business_id VARCHAR,
+        user_id VARCHAR,
+        date TIMESTAMP
+    );""",
+    """CREATE TABLE Zipcodes (
+        zip_code VARCHAR(5) PRIMARY KEY,
+        population INT,
+        avg_income NUMERIC(10, 1)
+    );""",
+    "CREATE INDEX businesses_city_idx ON Businesses (state, city);",
+    "CREATE INDEX businesses_postal_code_idx ON Businesses (postal_code);",
+]
+
+HOURS = '{"Monday": "9:0-17:0", "Tuesday": "9:0-17:0", "Wednesday": "9:0-17:0", "Thursday": "9:0-17:0", "Friday": "9:0-21:0"}'
+
+def zipf_choice(rng, n, size, a=1.3):
+    #indexes in [0, n) where low indexes are far more common, like real cities and categories
+    return (rng.zipf(a, size) - 1) % n
+
+def make_geography(rng, businesses):
+    zip_count = max(10, businesses // 200)
+    city_count = max(5, zip_count // 8)
+    zip_codes = np.array([f"{z:05d}" for z in rng.choice(np.arange(10000, 99999), zip_count, replace=False)])
+    zip_city = zipf_choice(rng, city_count, zip_count, a=1.5)
+    city_state = zipf_choice(rng, len(STATES), city_count, a=1.4)
+    city_names = np.array([f"City {c}" for c in range(city_count)])
+    city_lat = rng.uniform(25, 48, city_count)
+    city_lon = rng.uniform(-122, -70, city_count)
+    return zip_codes, zip_city, city_state, city_names, city_lat, city_lon
+
+def generate_businesses(rng, count, geography, chunk_size):
+    zip_codes, zip_city, city_state, city_names, city_lat, city_lon = geography
+    for start in range(0, count, chunk_size):
+        n = min(chunk_size, count - start)
+        zips = zipf_choice(rng, len(zip_codes), n, a=1.2)
+        cities = zip_city[zips]
+        lat = city_lat[cities] + rng.normal(0, 0.05, n)
+        lon = city_lon[cities] + rng.normal(0, 0.05, n)
+        stars = np.round(rng.uniform(1, 5, n) * 2) / 2
+        category_counts = rng.integers(1, 5, n)
+        is_open = rng.random(n) < 0.8
+        rows = []
+        for i in range(n):
+            picked = np.unique(zipf_choice(rng, len(CATEGORIES), category_counts[i], a=1.2))
+            rows.append((
+                f"b{start + i:010d}", f"Business {start + i}", city_names[cities[i]],
+                STATES[city_state[cities[i]]], zip_codes[zips[i]], float(lat[i]), float(lon[i]),
+                float(stars[i]), 0, float(stars[i]), 0, bool(is_open[i]), HOURS,
+                ", ".join(CATEGORIES[c] for c in picked),
+            ))
+        yield rows
+
+def generate_activity(rng, businesses, per_business_mean, chunk_size, with_stars):
+    #heavy-tailed per-business counts, a few businesses get most of the activity
+    next_id = 1
+    start_date = datetime.datetime(2015, 1, 1)
+    for start in range(0, businesses, chunk_size):
+        n = min(chunk_size, businesses - start)
+        counts = np.minimum(rng.zipf(1.8, n) * per_business_mean // 2, per_business_mean * 500)
+        total = int(counts.sum())
+        owners = np.repeat(np.arange(start, start + n), counts)
+        users = rng.integers(0, max(1000, businesses * 5), total)
+        days = rng.integers(0, 3650, total)
+        stars = rng.integers(1, 6, total) if with_stars else None
+        rows = []
+        for j in range(total):
+            date = start_date + datetime.timedelta(days=int(days[j]))
+            if with_stars:
+                rows.append((next_id + j, f"b{owners[j]:010d}", f"u{users[j]}", int(stars[j]), date))
+            else:
+                rows.append((next_id + j, f"b{owners[j]:010d}", f"u{users[j]}", date))
+        next_id += total
+        yield rows
+
+def generate_zipcodes(rng, zip_codes):
+    population = rng.integers(500, 120000, len(zip_codes))
+    income = np.round(rng.uniform(25000, 180000, len(zip_codes)), 1)
+    return [(z, int(p), float(i)) for z, p, i in zip(zip_codes, population, income)]
+
+def load(conn, businesses, seed=42, reviews_per_business=8, checkins_per_business=12, chunk_size=50000):
+    rng = np.random.default_rng(seed)
+    geography = make_geography(rng, businesses)
+    counts = {}
+    with conn.cursor() as cursor:
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        conn.commit()
+
+        start = time.perf_counter()
+        counts["businesses"] = 0
+        for rows in generate_businesses(rng, businesses, geography, chunk_size):
+            counts["businesses"] += bulkload.copy_rows(cursor, "businesses", [
+                "business_id", "name", "city", "state", "postal_code", "latitude", "longitude", "stars",
+                "review_count", "reviewrating", "numCheckins", "is_open", "hours", "categories",
+            ], rows)
+            conn.commit()
+        counts["reviews"] = 0
+        for rows in generate_activity(rng, businesses, reviews_per_business, chunk_size // 10, True):
+            counts["reviews"] += bulkload.copy_rows(cursor, "reviews",
+                                                    ["review_id", "business_id", "user_id", "stars", "date"], rows)
+            conn.commit()
+        counts["checkins"] = 0
+        for rows in generate_activity(rng, businesses, checkins_per_business, chunk_size // 10, False):
+            counts["checkins"] += bulkload.copy_rows(cursor, "checkins",
+                                                     ["checkin_id", "business_id", "user_id", "date"], rows)
+            conn.commit()
+
+        #the finder reads these denormalized counts straight off businesses
+        cursor.execute("""
+            UPDATE Businesses b SET review_count = r.n, reviewrating = r.avg_stars
+            FROM (SELECT business_id, COUNT(*) AS n, AVG(stars) AS avg_stars FROM Reviews GROUP BY business_id) r
+            WHERE r.business_id = b.business_id;
+        """)
+        cursor.execute("""
+            UPDATE Businesses b SET "numCheckins" = c.n
+            FROM (SELECT business_id, COUNT(*) AS n FROM CheckIns GROUP BY business_id) c
+            WHERE c.business_id = b.business_id;
+        """)
+        conn.commit()
+        cursor.execute("ANALYZE;")
+        conn.commit()
+        counts["load_seconds"] = time.perf_counter() - start
+    counts["zipcodes"] = generate_zipcodes(rng, geography[0])
+    return counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load a deterministic synthetic Yelp-style dataset. Drops the existing tables!")
+    parser.add_argument("--businesses", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reviews-per-business", type=int, default=8)
+    parser.add_argument("--checkins-per-business", type=int, default=12)
+    args = parser.parse_args()
+
+    conn = db.connect_db(application_name="yelpsim-gen-data")
+    counts = load(conn, args.businesses, seed=args.seed,
+                  reviews_per_business=args.reviews_per_business,
+                  checkins_per_business=args.checkins_per_business)
+    zipcodes = counts.pop("zipcodes")
+    bulkload.diff_upsert(conn, "zipcodes", ["zip_code"], ["population", "avg_income"], zipcodes)
+    print({**counts, "zipcodes": len(zipcodes)})
+    conn.close()
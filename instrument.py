@@ -0,0 +1,274 @@
+import os
+import sys
+import json
+import time
+import atexit
+import bisect
+import tempfile
+import threading
+import http.server
+from collections import defaultdict
+
+import psycopg2
+import psycopg2.extensions
+
+#per-query latency histograms, rows and bytes fetched, and EXPLAIN capture for slow queries.
+#db.py only installs InstrumentedCursor when YELPSIM_METRICS_FILE or YELPSIM_METRICS_PORT is set,
+#so with instrumentation off the plain psycopg2 cursor runs and nothing here is on the hot path
+
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+#only these are safe to re-run under EXPLAIN ANALYZE, everything else could write twice
+EXPLAINABLE = ("SELECT", "WITH", "EXECUTE", "TABLE", "VALUES")
+
+class QueryStats:
+    def __init__(self):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.fetch_seconds = 0.0
+        self.slow = 0
+
+class Metrics:
+    def __init__(self):
+        self.queries = defaultdict(QueryStats)
+        self.lock = threading.Lock()
+        self.slow_query_seconds = 0.5
+        self.explain_interval = 60.0
+        self.explain_log = "slow_queries.log"
+        self.metrics_file = None
+        self.write_interval = 10.0
+        self._last_explain = {}
+        self._write_lock = threading.Lock()
+        self._writer_pid = None
+
+    def observe(self, name, seconds):
+        with self.lock:
+            stats = self.queries[name]
+            stats.bucket_counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+            stats.count += 1
+            stats.seconds += seconds
+            if seconds >= self.slow_query_seconds:
+                stats.slow += 1
+        if self.metrics_file and self._writer_pid != os.getpid():
+            self._start_writer()
+
+    def observe_fetch(self, name, rows, size, seconds):
+        with self.lock:
+            stats = self.queries[name]
+            stats.rows += rows
+            stats.bytes += size
+            stats.fetch_seconds += seconds
+
+    def should_explain(self, name):
+        now = time.monotonic()
+        with self.lock:
+            if now - self._last_explain.get(name, -self.explain_interval) < self.explain_interval:
+                return False
+            self._last_explain[name] = now
+            return True
+
+    def render(self):
+        lines = [
+            "# HELP yelpsim_query_duration_seconds Query execution latency.",
+            "# TYPE yelpsim_query_duration_seconds histogram",
+        ]
+        with self.lock:
+            snapshot = sorted(self.queries.items())
+            for name, stats in snapshot:
+                cumulative = 0
+                for bound, count in zip(BUCKETS + [float("inf")], stats.bucket_counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'yelpsim_query_duration_seconds_bucket{{query="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'yelpsim_query_duration_seconds_sum{{query="{name}"}} {stats.seconds}')
+                lines.append(f'yelpsim_query_duration_seconds_count{{query="{name}"}} {stats.count}')
+            for metric, kind, help_text, attr in (
+                ("yelpsim_query_rows_total", "counter", "Rows fetched.", "rows"),
+                ("yelpsim_query_bytes_total", "counter", "Approximate bytes of row data fetched.", "bytes"),
+                ("yelpsim_query_fetch_seconds_total", "counter", "Time spent in fetch calls.", "fetch_seconds"),
+                ("yelpsim_query_slow_total", "counter", "Executions over the slow query threshold.", "slow"),
+            ):
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} {kind}")
+                for name, stats in snapshot:
+                    lines.append(f'{metric}{{query="{name}"}} {getattr(stats, attr)}')
+        return "\n".join(lines) + "\n"
+
+    def _start_writer(self):
+        #one writer thread per process; threads do not survive fork, so a forked import worker
+        #starts its own the first time it runs a query
+        with self._write_lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+        threading.Thread(target=self._write_loop, name="metrics-writer", daemon=True).start()
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.write_interval)
+            self.write()
+
+    def write(self):
+        #never raises, metrics I/O must not fail the work being measured
+        if not self.metrics_file:
+            return
+        path = self.metrics_file.format(pid=os.getpid())
+        try:
+            with self._write_lock:
+                fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".",
+                                                dir=os.path.dirname(path) or ".")
+                try:
+                    with os.fdopen(fd, "w") as f:
+                        f.write(self.render())
+                    #mkstemp files are owner-only, a textfile collector may run as another user
+                    os.chmod(tmp_path, 0o644)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+        except OSError as e:
+            print(f"metrics: could not write {path}: {e}", file=sys.stderr)
+
+metrics = Metrics()
+
+def _row_size(row):
+    size = 0
+    for value in row:
+        if isinstance(value, (str, bytes)):
+            size += len(value)
+        elif value is not None:
+            size += 8
+    return size
+
+def _query_name(sql):
+    #prepared statements are named already, anything else is named after the function that ran it
+    if isinstance(sql, str) and sql.startswith("EXECUTE "):
+        return sql.split()[1]
+    if isinstance(sql, str) and sql.startswith("PREPARE "):
+        return "prepare_" + sql.split()[1]
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else "unknown"
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    query_name = None
+
+    def execute(self, query, vars=None):
+        self.query_name = _query_name(query)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe(self.query_name, elapsed)
+            if elapsed >= metrics.slow_query_seconds:
+                self._capture_explain(query, vars, elapsed)
+
+    def copy_expert(self, sql, file, size=8192):
+        name = _query_name(sql)
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            metrics.observe(name, time.perf_counter() - start)
+
+    def _fetched(self, rows, start):
+        metrics.observe_fetch(self.query_name or "unknown", len(rows),
+                              sum(_row_size(row) for row in rows), time.perf_counter() - start)
+        return rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched([row] if row is not None else [], start)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        return self._fetched(super().fetchmany(size) if size is not None else super().fetchmany(), start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        return self._fetched(super().fetchall(), start)
+
+    def _capture_explain(self, query, vars, elapsed):
+        sql = query if isinstance(query, str) else query.as_string(self.connection)
+        if not sql.lstrip().upper().startswith(EXPLAINABLE) or self.name is not None:
+            return
+        if self.connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            return
+        if not metrics.should_explain(self.query_name):
+            return
+        #the re-run shares the caller's transaction, a savepoint keeps a failed EXPLAIN (timeout,
+        #cancel) from leaving it aborted. With autocommit there is no transaction to protect
+        savepoint = not self.connection.autocommit
+        try:
+            #a plain cursor so the EXPLAIN itself is not measured or explained again
+            with self.connection.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+                if savepoint:
+                    cur.execute("SAVEPOINT yelpsim_explain")
+                try:
+                    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT TEXT) " + sql, vars)
+                    plan = "\n".join(row[0] for row in cur.fetchall())
+                except psycopg2.Error as e:
+                    plan = f"EXPLAIN failed: {e}"
+                    if savepoint:
+                        cur.execute("ROLLBACK TO SAVEPOINT yelpsim_explain")
+                if savepoint:
+                    cur.execute("RELEASE SAVEPOINT yelpsim_explain")
+        except psycopg2.Error as e:
+            plan = f"EXPLAIN failed: {e}"
+        entry = {
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "query": self.query_name,
+            "seconds": round(elapsed, 4),
+            "sql": sql.strip(),
+            "params": repr(vars),
+            "plan": plan,
+        }
+        try:
+            with metrics.lock:
+                with open(metrics.explain_log, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"metrics: could not write {metrics.explain_log}: {e}", file=sys.stderr)
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+
+def serve(port):
+    global _server
+    if _server is None:
+        _server = http.server.ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+def configure(config):
+    #returns the cursor factory to install, or None when instrumentation is off
+    metrics_file = config.get("metrics_file")
+    metrics_port = int(config.get("metrics_port") or 0)
+    if not metrics_file and not metrics_port:
+        return None
+    metrics.slow_query_seconds = float(config.get("slow_query_ms") or 500) / 1000
+    metrics.explain_log = config.get("slow_query_log") or metrics.explain_log
+    if metrics_file and metrics.metrics_file is None:
+        metrics.metrics_file = metrics_file
+        atexit.register(metrics.write)
+    if metrics_port:
+        serve(metrics_port)
+    return InstrumentedCursor
@@ -1,17 +1,16 @@
 import json
-import psycopg2
+import argparse
+import concurrent.futures
 import datetime
-import requests
-import psycopg2.extras
+
+import db
+import bulkload
+import rollups
+import census_cache
 
 def connect_db():
     try:
-        return psycopg2.connect(
-            dbname="milestone1db",
-            user="postgres",
-            password="admin",
-            host="localhost"
-        )
+        return db.getconn()
     except Exception as e:
         print(f"Database connection error: {e}")
         return None
@@ -20,28 +19,40 @@ def cleanStr4SQL(s):
     return s.replace("'", "''")
 
 
-def fetch_data_from_census(api_url):
-    response = requests.get(api_url)
-    return response.json()[1:] if response.status_code == 200 else []
+CENSUS_URLS = {
+    "population": "https://api.census.gov/data/2020/acs/acs5?get=NAME,B01003_001E&for=zip%20code%20tabulation%20area:*",
+    "income": "https://api.census.gov/data/2020/acs/acs5/subject?get=NAME,S1903_C03_001E&for=zip%20code%20tabulation%20area:*",
+}
 
 
-def fetch_and_process_census_data():
-    conn = connect_db()
-    if not conn:
-        return
+def fetch_data_from_census(name, api_url, **cache_options):
+    data = census_cache.fetch_json(name, api_url, **cache_options)
+    return data[1:] if data else []
+
+
+def fetch_census_tables(**cache_options):
+    #both ACS tables are independent, so download them side by side
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(CENSUS_URLS)) as executor:
+        futures = {name: executor.submit(fetch_data_from_census, name, url, **cache_options)
+                   for name, url in CENSUS_URLS.items()}
+        return {name: future.result() for name, future in futures.items()}
 
-    population_url = "https://api.census.gov/data/2020/acs/acs5?get=NAME,B01003_001E&for=zip%20code%20tabulation%20area:*"
-    income_url = "https://api.census.gov/data/2020/acs/acs5/subject?get=NAME,S1903_C03_001E&for=zip%20code%20tabulation%20area:*"
 
-    population_data = fetch_data_from_census(population_url)
-    income_data = fetch_data_from_census(income_url)
+def fetch_and_process_census_data(**cache_options):
+    tables = fetch_census_tables(**cache_options)
+    population_data = tables["population"]
+    income_data = tables["income"]
 
     zip_population = {row[2]: int(row[1]) for row in population_data}
     zip_income = {row[2]: float(row[1]) for row in income_data if row[1] != "-666666666"}
 
     combined_data = [(zip_code, zip_population.get(zip_code, 0), zip_income.get(zip_code, 0.0)) for zip_code in set(zip_population) | set(zip_income)]
+
+    conn = connect_db()
+    if not conn:
+        return
     insert_data_into_db(conn, combined_data)
-    conn.close()
+    db.putconn(conn)
 
 
 
@@ -54,19 +65,26 @@ def insert_data_into_db(conn, data):
                 avg_income NUMERIC(10, 1)
             );
         """)
-        psycopg2.extras.execute_values(cursor, """
-            INSERT INTO Zipcodes (zip_code, population, avg_income) VALUES %s
-            ON CONFLICT (zip_code) DO UPDATE SET
-            population = EXCLUDED.population,
-            avg_income = EXCLUDED.avg_income;
-        """, data)
-        conn.commit()
+    conn.commit()
+    counts = bulkload.diff_upsert(conn, "zipcodes", ["zip_code"], ["population", "avg_income"], data)
+    print(f"zipcodes: {counts['inserted']} inserted, {counts['updated']} updated, {counts['unchanged']} unchanged")
+    if counts["inserted"] or counts["updated"]:
+        rollups.refresh_zipcode_stats(conn)
+        rollups.bump_data_generation(conn)
+    return counts
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--offline", action="store_true", help="replay cached or fixture responses, no network access")
+    parser.add_argument("--cache-dir", default=census_cache.CACHE_DIR, help="response cache, or a fixture directory with --offline")
+    parser.add_argument("--ttl", type=int, default=census_cache.DEFAULT_TTL, help="seconds before a cached response is revalidated")
+    args = parser.parse_args()
+
     conn = connect_db()
     if conn:
-        fetch_and_process_census_data()
-        conn.close()
+        db.putconn(conn)
+        fetch_and_process_census_data(cache_dir=args.cache_dir, ttl=args.ttl, offline=args.offline)
+        db.close_pool()
     else:
         print("Failed to connect to the database.")
\ No newline at end of file
@@ -0,0 +1,88 @@
+import time
+import threading
+import functools
+from collections import OrderedDict
+
+import psycopg2
+
+class QueryCache:
+    #LRU + TTL cache for read-only finder queries. Entries are also dropped wholesale whenever
+    #the data_generation stamp written by the import jobs changes.
+    def __init__(self, maxsize=512, ttl=600, generation_check_interval=5):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation_check_interval = generation_check_interval
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._generation_checked_at = 0.0
+
+    def current_generation(self, conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT generation FROM data_generation WHERE id = 1;")
+                row = cur.fetchone()
+            conn.commit()
+            return row[0] if row else None
+        except psycopg2.Error:
+            #no import has stamped this database yet
+            conn.rollback()
+            return None
+
+    def check_generation(self, conn, force=False):
+        now = time.monotonic()
+        if not force and now - self._generation_checked_at < self.generation_check_interval:
+            return
+        generation = self.current_generation(conn)
+        with self._lock:
+            self._generation_checked_at = now
+            if generation != self._generation:
+                self._generation = generation
+                self._clear()
+
+    def _clear(self):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def get_or_load(self, conn, key, loader):
+        self.check_generation(conn)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def cached(self, fn):
+        @functools.wraps(fn)
+        def wrapper(conn, *args):
+            return self.get_or_load(conn, (fn.__name__,) + args, lambda: fn(conn, *args))
+        wrapper.uncached = fn
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+                "generation": self._generation,
+            }
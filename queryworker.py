@@ -0,0 +1,153 @@
+import contextlib
+import itertools
+import threading
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+import db
+
+_local = threading.local()
+
+def watch(target):
+    #lets a query that is not pooled hand the running worker something to cancel (anything with a
+    #thread-safe cancel(), e.g. a connection it opened itself) while target is in use
+    worker = getattr(_local, "worker", None)
+    return worker.watch(target) if worker is not None else contextlib.nullcontext()
+
+def _discard(result):
+    #results that hold server resources (paged cursors) are released when nobody wants them
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    close = getattr(result, "close", None)
+    if close is not None:
+        close()
+
+class QuerySignals(QObject):
+    finished = pyqtSignal(str, int, object)
+    failed = pyqtSignal(str, int, str)
+    done = pyqtSignal(int)
+
+class QueryWorker(QRunnable):
+    #runs fn(conn, *args) on a pooled connection off the GUI thread, or fn(*args) when
+    #pooled is False and fn manages its own connection
+    def __init__(self, slot, token, fn, args, pooled=True):
+        super().__init__()
+        self.slot = slot
+        self.token = token
+        self.fn = fn
+        self.args = args
+        self.pooled = pooled
+        self.signals = QuerySignals()
+        self.cancelled = False
+        #target is only set while the query owns it, lock keeps a cancel from landing after putconn
+        self.target = None
+        self.lock = threading.Lock()
+        #the runner keeps the Python reference until done fires, Qt must not delete it under us
+        self.setAutoDelete(False)
+
+    def cancel(self):
+        self.cancelled = True
+        with self.lock:
+            if self.target is not None and not getattr(self.target, "closed", False):
+                #asks the server to abort the running statement, safe to call from another thread
+                self.target.cancel()
+
+    @contextlib.contextmanager
+    def watch(self, target):
+        with self.lock:
+            self.target = target
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.target = None
+
+    def run(self):
+        _local.worker = self
+        try:
+            self._run()
+        finally:
+            _local.worker = None
+            self.signals.done.emit(self.token)
+
+    def _run(self):
+        if self.cancelled:
+            return
+        try:
+            if not self.pooled:
+                result = self.fn(*self.args)
+                if self.cancelled:
+                    _discard(result)
+                else:
+                    self.signals.finished.emit(self.slot, self.token, result)
+                return
+            with db.connection() as conn:
+                with self.watch(conn):
+                    if self.cancelled:
+                        return
+                    result = self.fn(conn, *self.args)
+            if not self.cancelled:
+                self.signals.finished.emit(self.slot, self.token, result)
+        except Exception as e:
+            #a cancel we sent is expected, anything else (statement_timeout included) is reported
+            if not self.cancelled:
+                traceback.print_exc()
+                self.signals.failed.emit(self.slot, self.token, f"{type(e).__name__}: {e}")
+
+class QueryRunner(QObject):
+    #one in-flight query per slot, submitting again cancels the older query and drops its result
+    error = pyqtSignal(str, str)
+
+    def __init__(self, parent=None, max_threads=None):
+        super().__init__(parent)
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_threads or int(db.load_config()["pool_max"]))
+        self.tokens = itertools.count(1)
+        self.pending = {}
+        self.running = {}
+
+    def submit(self, slot, fn, args, callback, pooled=True, errback=None):
+        #errback(message) is called as well as the error signal, for callers holding state on the result
+        self.cancel(slot)
+        worker = QueryWorker(slot, next(self.tokens), fn, args, pooled)
+        worker.signals.finished.connect(self._on_finished)
+        worker.signals.failed.connect(self._on_failed)
+        worker.signals.done.connect(self._on_done)
+        self.pending[slot] = (worker, callback, errback)
+        self.running[worker.token] = worker
+        self.pool.start(worker)
+
+    def cancel(self, *slots):
+        for slot in slots or list(self.pending):
+            entry = self.pending.pop(slot, None)
+            if entry is not None:
+                entry[0].cancel()
+
+    def _current(self, slot, token):
+        entry = self.pending.get(slot)
+        if entry is None or entry[0].token != token:
+            return None
+        del self.pending[slot]
+        return entry
+
+    def _on_finished(self, slot, token, result):
+        entry = self._current(slot, token)
+        if entry is not None:
+            entry[1](result)
+        else:
+            _discard(result)
+
+    def _on_done(self, token):
+        self.running.pop(token, None)
+
+    def _on_failed(self, slot, token, message):
+        entry = self._current(slot, token)
+        if entry is not None:
+            if entry[2] is not None:
+                entry[2](message)
+            self.error.emit(slot, message)
+
+    def shutdown(self):
+        self.cancel()
+        self.pool.waitForDone()
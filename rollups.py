@@ -0,0 +1,68 @@
+ZIPCODE_STATS_VIEW = """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS zipcode_stats AS
+    WITH business_counts AS (
+        SELECT postal_code, COUNT(*) AS business_count
+        FROM businesses
+        WHERE postal_code IS NOT NULL
+        GROUP BY postal_code
+    ),
+    category_counts AS (
+        SELECT postal_code, category, COUNT(*) AS business_count
+        FROM business_categories
+        GROUP BY postal_code, category
+    ),
+    ranked_categories AS (
+        SELECT postal_code,
+               jsonb_agg(jsonb_build_array(category, business_count)
+                         ORDER BY business_count DESC, category) AS top_categories
+        FROM category_counts
+        GROUP BY postal_code
+    )
+    SELECT 
+        bc.postal_code AS zip_code,
+        bc.business_count,
+        z.population,
+        z.avg_income,
+        COALESCE(rc.top_categories, '[]'::jsonb) AS top_categories
+    FROM business_counts bc
+    LEFT JOIN zipcodes z ON z.zip_code = bc.postal_code
+    LEFT JOIN ranked_categories rc ON rc.postal_code = bc.postal_code;
+"""
+
+def refresh_zipcode_stats(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('zipcodes'), to_regclass('business_categories');")
+        if None in cursor.fetchone():
+            print("zipcode_stats: zipcodes or business_categories missing, run populate.py and business_import.py first")
+            conn.rollback()
+            return False
+        cursor.execute("SELECT to_regclass('zipcode_stats');")
+        exists = cursor.fetchone()[0] is not None
+        cursor.execute(ZIPCODE_STATS_VIEW)
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS zipcode_stats_zip_idx ON zipcode_stats (zip_code);")
+        #a freshly created view is already populated, later refreshes keep it readable while they run
+        if exists:
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY zipcode_stats;")
+    conn.commit()
+    return True
+
+def bump_data_generation(conn):
+    #finder caches drop everything they hold when this number changes
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS data_generation (
+                id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                generation BIGINT NOT NULL,
+                updated_at TIMESTAMP DEFAULT now()
+            );
+        """)
+        cursor.execute("""
+            INSERT INTO data_generation (id, generation, updated_at) VALUES (1, 1, now())
+            ON CONFLICT (id) DO UPDATE SET
+            generation = data_generation.generation + 1,
+            updated_at = EXCLUDED.updated_at
+            RETURNING generation;
+        """)
+        generation = cursor.fetchone()[0]
+    conn.commit()
+    return generation
@@ -0,0 +1,44 @@
+import numpy as np
+
+CHECKIN_POPULARITY_WEIGHT = 0.5
+REVIEW_POPULARITY_WEIGHT = 0.5
+
+CHECKIN_SUCCESS_WEIGHT = 0.4
+REVIEW_SUCCESS_WEIGHT = 0.2
+
+def calculate_popularity_score(numCheckins, review_count):
+    return (CHECKIN_POPULARITY_WEIGHT * float(numCheckins)) + \
+           (REVIEW_POPULARITY_WEIGHT * float(review_count))
+
+def calculate_success_score(last_review_date, avg_rating, numCheckins):
+    numCheckins = float(numCheckins)
+    #businesses without reviews have no average rating
+    avg_rating = float(avg_rating) if avg_rating is not None else 0.0
+
+    #normalize avg_rating by dividing by 5
+    normalized_review_rating = avg_rating / 5
+
+    #num checkins shouldnt devide by zero
+    return (CHECKIN_SUCCESS_WEIGHT * (numCheckins / max(numCheckins, 1))) + \
+           (REVIEW_SUCCESS_WEIGHT * normalized_review_rating)
+
+def popularity_scores(numCheckins, review_counts):
+    numCheckins = np.asarray(numCheckins, dtype=np.float64)
+    review_counts = np.asarray(review_counts, dtype=np.float64)
+    return CHECKIN_POPULARITY_WEIGHT * numCheckins + REVIEW_POPULARITY_WEIGHT * review_counts
+
+def success_scores(last_review_dates, avg_ratings, numCheckins):
+    numCheckins = np.asarray(numCheckins, dtype=np.float64)
+    avg_ratings = np.nan_to_num(np.asarray(avg_ratings, dtype=np.float64))
+    return CHECKIN_SUCCESS_WEIGHT * (numCheckins / np.maximum(numCheckins, 1)) + \
+           REVIEW_SUCCESS_WEIGHT * (avg_ratings / 5)
+
+def metric_columns(business_metrics):
+    #(business_id, review_count, numCheckins, avg_rating, last_review_date) rows -> column arrays
+    business_ids = [row[0] for row in business_metrics]
+    review_counts = np.fromiter((row[1] for row in business_metrics), dtype=np.float64, count=len(business_ids))
+    numCheckins = np.fromiter((row[2] for row in business_metrics), dtype=np.float64, count=len(business_ids))
+    avg_ratings = np.fromiter((np.nan if row[3] is None else row[3] for row in business_metrics),
+                              dtype=np.float64, count=len(business_ids))
+    last_review_dates = [row[4] for row in business_metrics]
+    return business_ids, review_counts, numCheckins, avg_ratings, last_review_dates
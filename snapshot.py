@@ -0,0 +1,455 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import datetime
+import numpy as np
+
+import db
+from spatial import GridIndex
+
+#a read-only, memory-mapped columnar copy of what the finder shows. Rows are stored sorted by
+#(state, city, postal_code, name) so a state or city is one contiguous slice, strings are kept
+#Arrow-style as one utf-8 buffer plus offsets, and low-cardinality strings are dictionary
+#encoded against a sorted vocabulary so code order is alphabetical order
+
+#bumped whenever the files change shape or meaning, Snapshot.load refuses other versions.
+#3 stores stars and reviewrating as float64 and ranks names case-insensitively first
+FORMAT_VERSION = 3
+
+SNAPSHOT_QUERY = """
+    SELECT b.business_id, b.name, b.city, b.state, b.postal_code, b.stars, b.review_count,
+           b.reviewrating, b."numCheckins", b.is_open, b.popularity_score, b.success_score,
+           b.latitude, b.longitude,
+           COALESCE(array_agg(bc.category) FILTER (WHERE bc.category IS NOT NULL), '{}') AS categories
+    FROM businesses b
+    LEFT JOIN business_categories bc ON bc.business_id = b.business_id
+    GROUP BY b.business_id
+"""
+
+#columns that change when scores are recomputed, these are patched in place on refresh
+SCORE_QUERY = """
+    SELECT business_id, stars, review_count, reviewrating, "numCheckins", is_open,
+           popularity_score, success_score
+    FROM businesses
+    WHERE business_id IN (SELECT business_id FROM touched_businesses)
+"""
+SCORE_COLUMNS = ["stars", "review_count", "reviewrating", "numCheckins", "is_open", "popularity", "success"]
+
+NUMERIC_COLUMNS = {
+    "stars": np.float64, "review_count": np.int32, "reviewrating": np.float64, "numCheckins": np.int32,
+    "is_open": np.bool_, "popularity": np.float64, "success": np.float64,
+    "latitude": np.float64, "longitude": np.float64,
+}
+
+class StringColumn:
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, values):
+        encoded = [value.encode() for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode()
+
+    def index(self, value):
+        #binary search, only valid for sorted vocabularies
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self[lo] == value else -1
+
+def _encode(values):
+    vocab = sorted(set(values))
+    lookup = {value: code for code, value in enumerate(vocab)}
+    return np.array([lookup[value] for value in values], dtype=np.int32), vocab
+
+def _csr(groups, count):
+    #(offsets, values) listing, for each group id, the positions that belong to it in ascending order
+    order = np.argsort(groups, kind="stable")
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(groups, minlength=count), out=offsets[1:])
+    return offsets, order.astype(np.int64)
+
+def _gather(offsets, values, rows):
+    #values[offsets[r]:offsets[r + 1]] for every r in rows, concatenated, without a Python loop
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    if lengths.sum() == 0:
+        return values[:0]
+    shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return values[shifts + np.arange(lengths.sum())]
+
+def _num(value, kind=float):
+    return None if value is None or (kind is float and np.isnan(value)) else kind(value)
+
+def build(conn, path):
+    start = time.perf_counter()
+    cursor = conn.cursor(name="snapshot_businesses")
+    cursor.itersize = 50000
+    cursor.execute(SNAPSHOT_QUERY)
+    raw = {key: [] for key in ["business_id", "name", "city", "state", "postal_code", "categories"] + list(NUMERIC_COLUMNS)}
+    for row in cursor:
+        (business_id, name, city, state, postal_code, stars, review_count, reviewrating,
+         numCheckins, is_open, popularity, success, latitude, longitude, categories) = row
+        raw["business_id"].append(business_id)
+        raw["name"].append(name or "")
+        raw["city"].append(city or "")
+        raw["state"].append(state or "")
+        raw["postal_code"].append(postal_code or "")
+        raw["categories"].append(categories)
+        for key, value in zip(NUMERIC_COLUMNS, (stars, review_count, reviewrating, numCheckins, is_open,
+                                                popularity, success, latitude, longitude)):
+            raw[key].append(np.nan if value is None and NUMERIC_COLUMNS[key] is np.float64
+                            else (value or 0))
+    cursor.close()
+
+    generation, zip_rows = None, {}
+    with conn.cursor() as cur:
+        if _has_table(cur, "data_generation"):
+            cur.execute("SELECT generation FROM data_generation WHERE id = 1;")
+            row = cur.fetchone()
+            generation = row[0] if row else None
+        if _has_table(cur, "zipcodes"):
+            cur.execute("SELECT zip_code, population, avg_income FROM zipcodes;")
+            zip_rows = {row[0]: row[1:] for row in cur.fetchall()}
+    conn.commit()
+
+    state_codes, state_vocab = _encode(raw["state"])
+    city_codes, city_vocab = _encode(raw["city"])
+    zip_codes, zip_vocab = _encode(raw["postal_code"])
+    #case-insensitive first, closer to the database collation than plain code point order
+    name_order = sorted(range(len(raw["name"])), key=lambda i: (raw["name"][i].casefold(), raw["name"][i]))
+    name_rank = np.empty(len(name_order), dtype=np.int64)
+    name_rank[name_order] = np.arange(len(name_order))
+
+    #state, then city, then zipcode, then name; lexsort takes the most significant key last
+    order = np.lexsort((name_rank, zip_codes, city_codes, state_codes))
+    rank_order = np.argsort(name_rank[order])
+    name_rank = np.empty(len(order), dtype=np.int64)
+    name_rank[rank_order] = np.arange(len(order))
+
+    category_vocab = sorted({c for categories in raw["categories"] for c in categories})
+    category_lookup = {c: code for code, c in enumerate(category_vocab)}
+    row_categories = [raw["categories"][i] for i in order]
+    cat_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in row_categories], out=cat_offsets[1:])
+    cat_codes = np.array([category_lookup[c] for categories in row_categories for c in categories], dtype=np.int32)
+    cat_owner = np.repeat(np.arange(len(order)), np.diff(cat_offsets))
+    catrows_offsets, catrows_positions = _csr(cat_codes, len(category_vocab))
+    catrows = cat_owner[catrows_positions]
+
+    zip_sorted = zip_codes[order]
+    zip_offsets, zip_rows_order = _csr(zip_sorted, len(zip_vocab))
+
+    #rows by lowercased name, for the finder's prefix name search
+    lowered = [raw["name"][i].lower() for i in order]
+    lower_order = np.array(sorted(range(len(order)), key=lowered.__getitem__), dtype=np.int64)
+
+    ids = [raw["business_id"][i] for i in order]
+    id_order = np.array(sorted(range(len(ids)), key=ids.__getitem__), dtype=np.int64)
+
+    arrays = {
+        "state_codes": state_codes[order], "city_codes": city_codes[order], "zip_codes": zip_sorted,
+        "name_rank": name_rank, "cat_offsets": cat_offsets, "cat_codes": cat_codes,
+        "catrows_offsets": catrows_offsets, "catrows": catrows,
+        "zip_offsets": zip_offsets, "zip_rows": zip_rows_order, "id_order": id_order, "lower_order": lower_order,
+        "zip_population": np.array([_zip_value(zip_rows, z, 0, -1) for z in zip_vocab], dtype=np.int64),
+        "zip_income": np.array([_zip_value(zip_rows, z, 1, np.nan) for z in zip_vocab], dtype=np.float64),
+    }
+    for key, dtype in NUMERIC_COLUMNS.items():
+        arrays[key] = np.asarray(raw[key], dtype=dtype)[order]
+    strings = {
+        "business_id": ids, "name": [raw["name"][i] for i in order],
+        "state_vocab": state_vocab, "city_vocab": city_vocab, "zip_vocab": zip_vocab,
+        "category_vocab": category_vocab,
+    }
+
+    #written next to the live snapshot and swapped in, readers keep their old mapping until they reload
+    tmp_path = path + ".new"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for key, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{key}.npy"), array)
+    for key, values in strings.items():
+        column = StringColumn.build(values)
+        np.save(os.path.join(tmp_path, f"{key}.data.npy"), column.data)
+        np.save(os.path.join(tmp_path, f"{key}.offsets.npy"), column.offsets)
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({"version": FORMAT_VERSION, "rows": len(order), "generation": generation,
+                   "built_at": datetime.datetime.now().isoformat(timespec="seconds")}, f)
+    if os.path.exists(path):
+        shutil.rmtree(path + ".old", ignore_errors=True)
+        os.rename(path, path + ".old")
+    os.rename(tmp_path, path)
+    shutil.rmtree(path + ".old", ignore_errors=True)
+    print(f"snapshot: {len(order)} businesses written to {path} in {time.perf_counter() - start:.1f}s")
+    return len(order)
+
+def _has_table(cur, table):
+    cur.execute("SELECT to_regclass(%s);", (table,))
+    return cur.fetchone()[0] is not None
+
+def _zip_value(zip_rows, zip_code, index, missing):
+    value = zip_rows.get(zip_code, (None, None))[index]
+    return missing if value is None else value
+
+def refresh(conn, path, incremental=False):
+    #patch score columns for touched_businesses in place, or rebuild when rows may have moved
+    if not incremental or not os.path.exists(os.path.join(path, "meta.json")):
+        return build(conn, path)
+    try:
+        snapshot = Snapshot.load(path, writable=True)
+    except ValueError:
+        #built by an older format version, it can only be replaced
+        return build(conn, path)
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM businesses;")
+        if cur.fetchone()[0] != snapshot.rows:
+            return build(conn, path)
+        cur.execute(SCORE_QUERY)
+        changed = cur.fetchall()
+    conn.commit()
+    for business_id, *values in changed:
+        row = snapshot.row_of(business_id)
+        if row < 0:
+            return build(conn, path)
+        for key, value in zip(SCORE_COLUMNS, values):
+            column = snapshot.columns[key]
+            column[row] = np.nan if value is None and column.dtype.kind == "f" else (value or 0)
+    for key in SCORE_COLUMNS:
+        snapshot.columns[key].flush()
+    print(f"snapshot: {len(changed)} businesses updated in place")
+    return len(changed)
+
+class Snapshot:
+    #answers the finder's query functions from the memory-mapped arrays, no database needed
+    def __init__(self, path, columns, strings, meta):
+        self.path = path
+        self.columns = columns
+        self.strings = strings
+        self.meta = meta
+        self.rows = meta["rows"]
+        self._spatial = None
+
+    @classmethod
+    def load(cls, path, writable=False):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path} is snapshot format {meta.get('version')}, expected {FORMAT_VERSION}")
+        columns, strings = {}, {}
+        for filename in os.listdir(path):
+            if not filename.endswith(".npy") or filename.endswith((".data.npy", ".offsets.npy")):
+                continue
+            key = filename[:-4]
+            mode = "r+" if writable and key in SCORE_COLUMNS else "r"
+            columns[key] = np.load(os.path.join(path, filename), mmap_mode=mode)
+        for filename in os.listdir(path):
+            if filename.endswith(".data.npy"):
+                key = filename[:-len(".data.npy")]
+                strings[key] = StringColumn(
+                    np.load(os.path.join(path, filename), mmap_mode="r"),
+                    np.load(os.path.join(path, f"{key}.offsets.npy"), mmap_mode="r"),
+                )
+        return cls(path, columns, strings, meta)
+
+    def row_of(self, business_id):
+        ids, id_order = self.strings["business_id"], self.columns["id_order"]
+        lo, hi = 0, len(id_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ids[id_order[mid]] < business_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return int(id_order[lo]) if lo < len(id_order) and ids[id_order[lo]] == business_id else -1
+
+    def _range(self, state, city=None):
+        state_code = self.strings["state_vocab"].index(state)
+        if state_code < 0:
+            return 0, 0
+        codes = self.columns["state_codes"]
+        lo, hi = np.searchsorted(codes, state_code, "left"), np.searchsorted(codes, state_code, "right")
+        if city is None:
+            return lo, hi
+        city_code = self.strings["city_vocab"].index(city)
+        if city_code < 0:
+            return 0, 0
+        cities = self.columns["city_codes"][lo:hi]
+        return lo + np.searchsorted(cities, city_code, "left"), lo + np.searchsorted(cities, city_code, "right")
+
+    def _zip_rows(self, zipcode):
+        zip_code = self.strings["zip_vocab"].index(zipcode)
+        if zip_code < 0:
+            return np.empty(0, dtype=np.int64)
+        offsets = self.columns["zip_offsets"]
+        return np.sort(self.columns["zip_rows"][offsets[zip_code]:offsets[zip_code + 1]])
+
+    def _category_rows(self, zipcode, category):
+        category_code = self.strings["category_vocab"].index(category)
+        if category_code < 0:
+            return np.empty(0, dtype=np.int64)
+        offsets = self.columns["catrows_offsets"]
+        in_category = self.columns["catrows"][offsets[category_code]:offsets[category_code + 1]]
+        return np.intersect1d(self._zip_rows(zipcode), in_category, assume_unique=True)
+
+    def _by_name(self, rows):
+        return rows[np.argsort(self.columns["name_rank"][rows])]
+
+    def _top(self, rows, score, n=10):
+        scores = np.nan_to_num(self.columns[score][rows], nan=-np.inf)
+        return rows[np.argsort(-scores, kind="stable")[:n]]
+
+    def _vocab_values(self, key, codes):
+        vocab = self.strings[key]
+        return [(vocab[code],) for code in np.unique(codes)]
+
+    def get_states(self):
+        return self._vocab_values("state_vocab", self.columns["state_codes"])
+
+    def get_cities(self, selected_state):
+        lo, hi = self._range(selected_state)
+        return self._vocab_values("city_vocab", self.columns["city_codes"][lo:hi])
+
+    def get_zipcodes(self, selected_city, selected_state):
+        lo, hi = self._range(selected_state, selected_city)
+        return self._vocab_values("zip_vocab", self.columns["zip_codes"][lo:hi])
+
+    def get_businesses(self, selected_city, selected_state):
+        lo, hi = self._range(selected_state, selected_city)
+        names = self.strings["name"]
+        return [(names[row], selected_city, selected_state) for row in self._by_name(np.arange(lo, hi))]
+
+    def get_categories(self, selected_zipcode):
+        codes = _gather(self.columns["cat_offsets"], self.columns["cat_codes"], self._zip_rows(selected_zipcode))
+        return self._vocab_values("category_vocab", codes)
+
+    def _business_row(self, row):
+        c = self.columns
+        return (self.strings["name"][row], self.strings["city_vocab"][c["city_codes"][row]],
+                self.strings["state_vocab"][c["state_codes"][row]], _num(c["stars"][row]),
+                int(c["review_count"][row]), _num(c["reviewrating"][row]), int(c["numCheckins"][row]),
+                bool(c["is_open"][row]), None)
+
+    def get_businesses_by_category(self, selected_zipcode, selected_category):
+        rows = self._by_name(self._category_rows(selected_zipcode, selected_category))
+        return [self._business_row(row) for row in rows]
+
+    def get_zipcode_stats(self, selected_zipcode):
+        zip_code = self.strings["zip_vocab"].index(selected_zipcode)
+        if zip_code < 0:
+            return None
+        rows = self._zip_rows(selected_zipcode)
+        codes = _gather(self.columns["cat_offsets"], self.columns["cat_codes"], rows)
+        counts = np.bincount(codes, minlength=len(self.strings["category_vocab"]))
+        ranked = np.lexsort((np.arange(len(counts)), -counts))
+        vocab = self.strings["category_vocab"]
+        top_categories = [[vocab[code], int(counts[code])] for code in ranked if counts[code]]
+        population = int(self.columns["zip_population"][zip_code])
+        return (len(rows), None if population < 0 else population,
+                _num(self.columns["zip_income"][zip_code]), top_categories)
+
+    def get_popular_businesses(self, zipcode, category):
+        c = self.columns
+        return [(self.strings["name"][row], _num(c["stars"][row]), int(c["review_count"][row]),
+                 int(c["numCheckins"][row]), _num(c["popularity"][row]))
+                for row in self._top(self._category_rows(zipcode, category), "popularity")]
+
+    def get_successful_businesses(self, zipcode, category):
+        c = self.columns
+        return [(self.strings["name"][row], int(c["review_count"][row]), int(c["numCheckins"][row]),
+                 _num(c["success"][row]))
+                for row in self._top(self._category_rows(zipcode, category), "success")]
+
+    def _lower_bound(self, prefix):
+        names, lower_order = self.strings["name"], self.columns["lower_order"]
+        lo, hi = 0, len(lower_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if names[lower_order[mid]].lower() < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def search_business_names(self, text, state=None, city=None, limit=25):
+        #prefix match only, substring matching needs the database's trigram index
+        prefix = text.strip().lower()
+        if not prefix:
+            return []
+        rows = self.columns["lower_order"][self._lower_bound(prefix):self._lower_bound(prefix + "\U0010ffff")]
+        if state:
+            lo, hi = self._range(state, city or None)
+            rows = rows[(rows >= lo) & (rows < hi)]
+        c = self.columns
+        return [(self.strings["name"][row], self.strings["city_vocab"][c["city_codes"][row]],
+                 self.strings["state_vocab"][c["state_codes"][row]], _num(c["stars"][row]),
+                 int(c["review_count"][row]), _num(c["reviewrating"][row]))
+                for row in rows[:limit]]
+
+    def spatial_index(self):
+        #built on first use, a couple hundred ms for a million businesses
+        if self._spatial is None:
+            self._spatial = GridIndex(self.columns["latitude"], self.columns["longitude"])
+        return self._spatial
+
+    def location_of(self, business_id):
+        row = self.row_of(business_id)
+        if row < 0:
+            return None
+        return _num(self.columns["latitude"][row]), _num(self.columns["longitude"][row])
+
+    def nearby_businesses(self, latitude, longitude, k=10, radius_km=None, category=None, rank_by="distance"):
+        #the k closest businesses, or with radius_km every business inside that radius, then the
+        #top k of those ranked by distance, popularity or success. category limits both to one category
+        allowed = None
+        if category:
+            category_code = self.strings["category_vocab"].index(category)
+            if category_code < 0:
+                return []
+            offsets = self.columns["catrows_offsets"]
+            allowed = self.columns["catrows"][offsets[category_code]:offsets[category_code + 1]]
+        index = self.spatial_index()
+        if radius_km is None:
+            rows, distances = index.nearest(latitude, longitude, k, allowed)
+        else:
+            rows, distances = index.within(latitude, longitude, radius_km, allowed)
+        if rank_by == "distance":
+            order = np.lexsort((rows, distances))
+        else:
+            scores = np.nan_to_num(self.columns[rank_by][rows], nan=-np.inf)
+            order = np.lexsort((distances, -scores))
+        rows, distances = rows[order[:k]], distances[order[:k]]
+        c = self.columns
+        return [(self.strings["name"][row], self.strings["city_vocab"][c["city_codes"][row]],
+                 self.strings["state_vocab"][c["state_codes"][row]], self.strings["zip_vocab"][c["zip_codes"][row]],
+                 _num(c["stars"][row]), int(c["review_count"][row]), _num(c["popularity"][row]),
+                 _num(c["success"][row]), float(distance))
+                for row, distance in zip(rows, distances)]
+
+    def get_search_bundle(self, zipcode, category):
+        #same fields as the finder's SearchBundle, the whole business list is already in memory
+        return (self.get_businesses_by_category(zipcode, category), False, self.get_zipcode_stats(zipcode),
+                self.get_popular_businesses(zipcode, category), self.get_successful_businesses(zipcode, category))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build a memory-mapped finder snapshot from the database")
+    parser.add_argument("path", nargs="?", default=db.load_config()["snapshot_path"] or "finder_snapshot")
+    args = parser.parse_args()
+    conn = db.connect_db(application_name="yelpsim-snapshot")
+    build(conn, args.path)
+    conn.close()
@@ -0,0 +1,127 @@
+import math
+import numpy as np
+
+#in-process spatial index over business coordinates. Points are bucketed into a uniform
+#latitude/longitude grid and stored sorted by cell, so every row of cells a query box touches is
+#one contiguous slice found with two binary searches. Distances are great-circle (haversine).
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+#half the earth's circumference, nothing is further away than this
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def _ranges(starts, ends):
+    #concatenated arange(start, end) for every pair, without a Python loop
+    lengths = ends - starts
+    total = lengths.sum()
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return shifts + np.arange(total)
+
+def _allowed(rows, allowed):
+    #rows that are also in allowed, which must be sorted
+    if allowed is None:
+        return np.ones(len(rows), dtype=bool)
+    if len(allowed) == 0:
+        return np.zeros(len(rows), dtype=bool)
+    positions = np.minimum(np.searchsorted(allowed, rows), len(allowed) - 1)
+    return allowed[positions] == rows
+
+class GridIndex:
+    def __init__(self, latitudes, longitudes, cell_km=2.0):
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        rows = np.flatnonzero(np.isfinite(latitudes) & np.isfinite(longitudes)
+                              & (np.abs(latitudes) <= 90) & (np.abs(longitudes) <= 180))
+        self.cell_km = cell_km
+        self.cell_degrees = cell_km / KM_PER_DEGREE
+        self.lon_cells = int(math.ceil(360 / self.cell_degrees)) + 1
+        self.lat_cells = int(math.ceil(180 / self.cell_degrees)) + 1
+        keys = self._lat_cell(latitudes[rows]) * self.lon_cells + self._lon_cell(longitudes[rows])
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.rows = rows[order]
+        self.latitudes = latitudes[self.rows]
+        self.longitudes = longitudes[self.rows]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _lat_cell(self, latitude):
+        return np.floor((np.asarray(latitude) + 90) / self.cell_degrees).astype(np.int64)
+
+    def _lon_cell(self, longitude):
+        return np.floor((np.asarray(longitude) + 180) / self.cell_degrees).astype(np.int64)
+
+    def _candidates(self, latitude, longitude, radius_km):
+        #positions of every point in the cells overlapping the query circle's bounding box
+        lat_span = radius_km / KM_PER_DEGREE
+        lat_rows = np.arange(max(int(self._lat_cell(latitude - lat_span)), 0),
+                             min(int(self._lat_cell(latitude + lat_span)), self.lat_cells - 1) + 1, dtype=np.int64)
+        widest = abs(latitude) + lat_span
+        lon_span = 180 if widest >= 90 else lat_span / math.cos(math.radians(widest))
+        #near a pole, or wide enough that the wrapped ranges would meet, every longitude is in play
+        if lon_span >= 180 - self.cell_degrees:
+            lon_ranges = [(0, self.lon_cells - 1)]
+        else:
+            lo = int(self._lon_cell(longitude - lon_span))
+            hi = int(self._lon_cell(longitude + lon_span))
+            #a box across the antimeridian wraps into two key ranges per row of cells
+            wrapped_lo = int(self._lon_cell(longitude - lon_span + 360)) if longitude - lon_span < -180 else None
+            wrapped_hi = int(self._lon_cell(longitude + lon_span - 360)) if longitude + lon_span > 180 else None
+            lon_ranges = [(max(lo, 0), min(hi, self.lon_cells - 1))]
+            if wrapped_lo is not None:
+                lon_ranges.append((wrapped_lo, self.lon_cells - 1))
+            if wrapped_hi is not None:
+                lon_ranges.append((0, wrapped_hi))
+        starts, ends = [], []
+        for lo, hi in lon_ranges:
+            starts.append(np.searchsorted(self.keys, lat_rows * self.lon_cells + lo, "left"))
+            ends.append(np.searchsorted(self.keys, lat_rows * self.lon_cells + hi, "right"))
+        return _ranges(np.concatenate(starts), np.concatenate(ends))
+
+    def within(self, latitude, longitude, radius_km, allowed=None):
+        #(rows, distances) of every point within radius_km, unordered. allowed is an optional
+        #sorted array of rows to keep, e.g. the businesses in one category
+        positions = self._candidates(latitude, longitude, radius_km)
+        rows = self.rows[positions]
+        keep = _allowed(rows, allowed)
+        positions, rows = positions[keep], rows[keep]
+        distances = haversine_km(latitude, longitude, self.latitudes[positions], self.longitudes[positions])
+        inside = distances <= radius_km
+        return rows[inside], distances[inside]
+
+    def nearest(self, latitude, longitude, k, allowed=None):
+        #(rows, distances) of the k closest points, closest first. Searches a growing radius; once
+        #a radius holds k points, everything closer than the k-th is inside it, so the answer is exact
+        radius_km = self.cell_km
+        while True:
+            rows, distances = self.within(latitude, longitude, radius_km, allowed)
+            if len(rows) >= k or radius_km >= MAX_DISTANCE_KM:
+                break
+            #grow roughly by how short we came up, assuming even density
+            growth = math.sqrt(k / len(rows)) if len(rows) else 4
+            radius_km = min(radius_km * min(max(growth, 1.5), 4), MAX_DISTANCE_KM)
+        if len(rows) > k:
+            closest = np.argpartition(distances, k - 1)[:k]
+            rows, distances = rows[closest], distances[closest]
+        order = np.lexsort((rows, distances))
+        return rows[order], distances[order]
+
+def naive_within(latitudes, longitudes, latitude, longitude, radius_km):
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    rows = np.flatnonzero(distances <= radius_km)
+    return rows, distances[rows]
+
+def naive_nearest(latitudes, longitudes, latitude, longitude, k):
+    distances = np.nan_to_num(haversine_km(latitude, longitude, latitudes, longitudes), nan=np.inf)
+    rows = np.argpartition(distances, min(k, len(distances)) - 1)[:k]
+    order = np.lexsort((rows, distances[rows]))
+    return rows[order], distances[rows][order]
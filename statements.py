@@ -0,0 +1,93 @@
+import itertools
+import re
+import threading
+from collections import defaultdict
+
+import psycopg2
+import psycopg2.errors
+
+#errors that mean a server-side prepared statement no longer fits the schema, or is gone
+STALE_STATEMENT_ERRORS = (
+    psycopg2.errors.FeatureNotSupported,        #cached plan must not change result type
+    psycopg2.errors.InvalidSqlStatementName,    #statement was deallocated (DISCARD ALL, etc.)
+    psycopg2.errors.UndefinedColumn,
+    psycopg2.errors.UndefinedTable,
+)
+
+def to_server_params(sql):
+    #psycopg2 %s placeholders -> $1, $2, ... for PREPARE
+    counter = itertools.count(1)
+    return re.sub(r"%s", lambda match: f"${next(counter)}", sql)
+
+class StatementRegistry:
+    #prepares each registered query once per connection and runs it with EXECUTE afterwards
+    def __init__(self):
+        self.queries = {}
+        self.counters = defaultdict(lambda: {"prepares": 0, "executions": 0, "fallbacks": 0})
+        self._prepared = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, sql):
+        self.queries[name] = sql.strip().rstrip(";")
+        return name
+
+    def _connection_key(self, conn):
+        #the backend pid tells apart a new connection that happens to reuse an old object id
+        return id(conn), conn.get_backend_pid()
+
+    def _prepared_names(self, conn):
+        key = self._connection_key(conn)
+        with self._lock:
+            return self._prepared.setdefault(key, set())
+
+    def execute(self, cur, name, params=()):
+        sql = self.queries[name]
+        prepared = self._prepared_names(cur.connection)
+        try:
+            if name not in prepared:
+                cur.execute(f"PREPARE {name} AS {to_server_params(sql)}")
+                prepared.add(name)
+                self._count(name, "prepares")
+            if params:
+                cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+            else:
+                cur.execute(f"EXECUTE {name}")
+            self._count(name, "executions")
+        except STALE_STATEMENT_ERRORS:
+            #re-prepared on the next call, this one runs as plain SQL
+            cur.connection.rollback()
+            self._deallocate(cur, name)
+            prepared.discard(name)
+            self._count(name, "fallbacks")
+            cur.execute(sql, params)
+
+    def _count(self, name, counter):
+        #the JSON service runs statements from many threads at once
+        with self._lock:
+            self.counters[name][counter] += 1
+
+    def _deallocate(self, cur, name):
+        cur.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s;", (name,))
+        if cur.fetchone():
+            cur.execute(f"DEALLOCATE {name}")
+
+    def forget(self, conn):
+        #called when a connection is closed, its backend pid may no longer be readable
+        with self._lock:
+            for key in [key for key in self._prepared if key[0] == id(conn)]:
+                del self._prepared[key]
+
+    def stats(self, conn=None):
+        with self._lock:
+            result = {name: dict(counter) for name, counter in self.counters.items()}
+        if conn is not None:
+            #generic_plans/custom_plans need PostgreSQL 14+
+            with conn.cursor() as cur:
+                cur.execute("SELECT name, generic_plans, custom_plans FROM pg_prepared_statements;")
+                for name, generic_plans, custom_plans in cur.fetchall():
+                    if name in result:
+                        result[name]["generic_plans"] = generic_plans
+                        result[name]["custom_plans"] = custom_plans
+        return result
+
+registry = StatementRegistry()
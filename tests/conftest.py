@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def scratch_conn():
+    #a connection to the configured database with search_path set to a throwaway schema, so
+    #fixture tables never touch the real ones. Skips when there is no PostgreSQL to talk to
+    psycopg2 = pytest.importorskip("psycopg2")
+    import db
+    try:
+        conn = db.connect_db(application_name="yelpsim-tests")
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"no PostgreSQL available: {e}")
+    schema = f"yelpsim_test_{os.getpid()}"
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE;")
+        cur.execute(f"CREATE SCHEMA {schema};")
+        cur.execute(f"SET search_path TO {schema};")
+    conn.commit()
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE;")
+        conn.commit()
+        conn.close()
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+import census_cache
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "census")
+URL = "https://census.example/acs5?get=NAME,B01003_001E"
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.content = json.dumps(body).encode() if body is not None else b""
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.content)
+
+@pytest.fixture
+def no_network(monkeypatch):
+    def get(url, **kwargs):
+        raise AssertionError(f"unexpected request to {url}")
+    monkeypatch.setattr(census_cache.requests, "get", get)
+
+@pytest.fixture
+def server(monkeypatch):
+    #records every request and answers with whatever the test queued
+    calls = []
+    responses = []
+    def get(url, headers=None, timeout=None):
+        calls.append((url, dict(headers or {})))
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    monkeypatch.setattr(census_cache.requests, "get", get)
+    return calls, responses
+
+def write_cache(cache_dir, body, **meta):
+    body_path, meta_path = census_cache._paths(str(cache_dir), "population")
+    with open(body_path, "w") as f:
+        json.dump(body, f)
+    with open(meta_path, "w") as f:
+        json.dump(dict({"url": URL}, **meta), f)
+    return meta_path
+
+def test_offline_replays_fixture_files(no_network):
+    population = census_cache.fetch_json("population", URL, cache_dir=FIXTURES, offline=True)
+    income = census_cache.fetch_json("income", URL, cache_dir=FIXTURES, offline=True)
+    assert population[1:] == [["ZCTA5 85001", "1500", "85001"], ["ZCTA5 89109", "8200", "89109"]]
+    assert income[2] == ["ZCTA5 89109", "54321", "89109"]
+
+def test_offline_miss_raises(no_network, tmp_path):
+    with pytest.raises(census_cache.OfflineCacheMiss):
+        census_cache.fetch_json("population", URL, cache_dir=str(tmp_path), offline=True)
+
+def test_fetch_writes_body_and_validators(server, tmp_path):
+    calls, responses = server
+    responses.append(FakeResponse(200, [["NAME"], ["a"]], {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024"}))
+    assert census_cache.fetch_json("population", URL, cache_dir=str(tmp_path)) == [["NAME"], ["a"]]
+    assert calls == [(URL, {})]
+    with open(tmp_path / "population.meta.json") as f:
+        meta = json.load(f)
+    assert meta["etag"] == '"v1"' and meta["last_modified"] == "Mon, 01 Jan 2024" and meta["url"] == URL
+
+def test_fresh_cache_is_used_without_a_request(no_network, tmp_path):
+    write_cache(tmp_path, [["NAME"], ["cached"]], fetched_at=time.time())
+    assert census_cache.fetch_json("population", URL, cache_dir=str(tmp_path)) == [["NAME"], ["cached"]]
+
+def test_expired_cache_revalidates_and_keeps_body_on_304(server, tmp_path):
+    calls, responses = server
+    meta_path = write_cache(tmp_path, [["NAME"], ["cached"]], etag='"v1"', last_modified="Mon, 01 Jan 2024",
+                            fetched_at=time.time() - 2 * census_cache.DEFAULT_TTL)
+    responses.append(FakeResponse(304))
+    assert census_cache.fetch_json("population", URL, cache_dir=str(tmp_path)) == [["NAME"], ["cached"]]
+    assert calls[0][1] == {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024"}
+    with open(meta_path) as f:
+        assert time.time() - json.load(f)["fetched_at"] < 60
+
+def test_changed_url_is_fetched_without_validators(server, tmp_path):
+    calls, responses = server
+    write_cache(tmp_path, [["NAME"], ["old"]], etag='"v1"', fetched_at=time.time())
+    responses.append(FakeResponse(200, [["NAME"], ["new"]]))
+    assert census_cache.fetch_json("population", URL + "&year=2021", cache_dir=str(tmp_path)) == [["NAME"], ["new"]]
+    assert calls[0][1] == {}
+
+def test_request_failure_falls_back_to_cache(server, tmp_path):
+    calls, responses = server
+    write_cache(tmp_path, [["NAME"], ["cached"]], fetched_at=0)
+    responses.append(requests.ConnectionError("network is down"))
+    assert census_cache.fetch_json("population", URL, cache_dir=str(tmp_path)) == [["NAME"], ["cached"]]
@@ -0,0 +1,55 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import gen_data
+import business_import
+
+DAY = datetime.datetime(2020, 1, 1)
+
+#edge cases on top of a tiny generated dataset: (business_id, reviews as (user, stars, date), checkin users)
+EDGE_CASES = [
+    ("x_reviews_only", [("u1", 4, DAY), ("u2", 2, DAY + datetime.timedelta(days=3))], []),
+    ("x_checkins_only", [], ["u1", "u2", "u2"]),
+    ("x_neither", [], []),
+    ("x_repeat_user", [("u1", 5, DAY), ("u1", 3, DAY + datetime.timedelta(days=1)), ("u2", 4, DAY)],
+     ["u1", "u1", "u3"]),
+]
+
+def load_fixture(conn):
+    gen_data.load(conn, 40, seed=7, chunk_size=1000)
+    review_id = checkin_id = 10 ** 9
+    with conn.cursor() as cur:
+        for business_id, reviews, checkins in EDGE_CASES:
+            cur.execute("INSERT INTO Businesses (business_id, name) VALUES (%s, %s);", (business_id, business_id))
+            for user_id, stars, date in reviews:
+                review_id += 1
+                cur.execute("INSERT INTO Reviews (review_id, business_id, user_id, stars, date) VALUES (%s, %s, %s, %s, %s);",
+                            (review_id, business_id, user_id, stars, date))
+            for user_id in checkins:
+                checkin_id += 1
+                cur.execute("INSERT INTO CheckIns (checkin_id, business_id, user_id, date) VALUES (%s, %s, %s, %s);",
+                            (checkin_id, business_id, user_id, DAY))
+    conn.commit()
+
+def test_metrics_query_matches_joined_query(scratch_conn):
+    load_fixture(scratch_conn)
+    with scratch_conn.cursor() as cur:
+        assert business_import.check_business_metrics(cur) == []
+
+def test_metrics_query_edge_cases(scratch_conn):
+    load_fixture(scratch_conn)
+    with scratch_conn.cursor() as cur:
+        #the unscoped query ends after its joins, so a WHERE can go straight on
+        cur.execute(business_import.METRICS_QUERY + " WHERE b.business_id LIKE %s", ("x%",))
+        rows = {row[0]: row[1:] for row in cur.fetchall()}
+
+    review_count, checkins, avg_rating, last_review = rows["x_reviews_only"]
+    assert (review_count, checkins, float(avg_rating), last_review) == (2, 0, 3.0, DAY + datetime.timedelta(days=3))
+    assert rows["x_checkins_only"] == (0, 2, None, None)
+    assert rows["x_neither"] == (0, 0, None, None)
+    review_count, checkins, avg_rating, last_review = rows["x_repeat_user"]
+    #distinct users for the counts, every review for the average
+    assert (review_count, checkins, float(avg_rating), last_review) == (2, 2, 4.0, DAY + datetime.timedelta(days=1))
@@ -0,0 +1,176 @@
+import os
+import csv
+import sys
+import time
+import argparse
+
+import psycopg2
+
+import db
+
+#every panel the finder shows for a zipcode, for all zipcodes in a state or city at once. Each
+#section is one set-based query read through a server-side cursor and written as it arrives,
+#so memory stays flat however big the state is. All sections read the same snapshot.
+
+#zipcodes with at least one business in the chosen state (and city). The panels are per zipcode,
+#so the numbers cover the whole zipcode even where it crosses a city line
+SCOPE = """
+    WITH scope_zips AS (
+        SELECT DISTINCT postal_code FROM businesses WHERE state = %(state)s {city_condition}
+    )
+"""
+
+SECTIONS = {
+    "stats": (SCOPE + """
+        SELECT zs.zip_code, zs.business_count, zs.population, zs.avg_income::float8
+        FROM zipcode_stats zs
+        JOIN scope_zips s ON s.postal_code = zs.zip_code
+        ORDER BY zs.zip_code;
+    """, [("zip_code", "str"), ("business_count", "int"), ("population", "int"), ("avg_income", "float")]),
+    "top_categories": (SCOPE + """
+        SELECT zs.zip_code, t.ord, t.entry->>0, (t.entry->>1)::int
+        FROM zipcode_stats zs
+        JOIN scope_zips s ON s.postal_code = zs.zip_code
+        CROSS JOIN LATERAL jsonb_array_elements(zs.top_categories) WITH ORDINALITY t(entry, ord)
+        ORDER BY zs.zip_code, t.ord;
+    """, [("zip_code", "str"), ("rank", "int"), ("category", "str"), ("business_count", "int")]),
+    "popular": (SCOPE + """
+        SELECT postal_code, category, rank, name, stars, review_count, "numCheckins", popularity_score
+        FROM (
+            SELECT bc.postal_code, bc.category, b.name, b.stars::float8 AS stars, b.review_count, b."numCheckins",
+                   b.popularity_score::float8 AS popularity_score,
+                   row_number() OVER (PARTITION BY bc.postal_code, bc.category
+                                      ORDER BY b.popularity_score DESC NULLS LAST, b.business_id) AS rank
+            FROM business_categories bc
+            JOIN scope_zips s ON s.postal_code = bc.postal_code
+            JOIN businesses b ON b.business_id = bc.business_id
+        ) ranked
+        WHERE rank <= %(top)s
+        ORDER BY postal_code, category, rank;
+    """, [("zip_code", "str"), ("category", "str"), ("rank", "int"), ("name", "str"), ("stars", "float"),
+          ("review_count", "int"), ("numCheckins", "int"), ("popularity_score", "float")]),
+    "successful": (SCOPE + """
+        SELECT postal_code, category, rank, name, review_count, "numCheckins", success_score
+        FROM (
+            SELECT bc.postal_code, bc.category, b.name, b.review_count, b."numCheckins",
+                   b.success_score::float8 AS success_score,
+                   row_number() OVER (PARTITION BY bc.postal_code, bc.category
+                                      ORDER BY b.success_score DESC NULLS LAST, b.business_id) AS rank
+            FROM business_categories bc
+            JOIN scope_zips s ON s.postal_code = bc.postal_code
+            JOIN businesses b ON b.business_id = bc.business_id
+        ) ranked
+        WHERE rank <= %(top)s
+        ORDER BY postal_code, category, rank;
+    """, [("zip_code", "str"), ("category", "str"), ("rank", "int"), ("name", "str"),
+          ("review_count", "int"), ("numCheckins", "int"), ("success_score", "float")]),
+}
+
+class CsvSink:
+    extension = "csv"
+
+    def __init__(self, path, columns):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class ParquetSink:
+    extension = "parquet"
+
+    def __init__(self, path, columns):
+        #pyarrow is only needed for this format
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("--format parquet needs pyarrow (pip install pyarrow)")
+        self.pyarrow = pyarrow
+        types = {"str": pyarrow.string(), "int": pyarrow.int64(), "float": pyarrow.float64()}
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        if rows:
+            arrays = [self.pyarrow.array(values, type=field.type) for values, field in zip(zip(*rows), self.schema)]
+            self.writer.write_batch(self.pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+SINKS = {"csv": CsvSink, "parquet": ParquetSink}
+
+def export_section(conn, name, params, city, sink_class, out_dir, prefix, batch_size):
+    sql, columns = SECTIONS[name]
+    sql = sql.format(city_condition="AND city = %(city)s" if city else "")
+    path = os.path.join(out_dir, f"{prefix}_{name}.{sink_class.extension}")
+    #written beside the target and renamed at the end, so cron never leaves half a file in place
+    tmp_path = path + ".tmp"
+    start = time.perf_counter()
+    count = 0
+    sink = sink_class(tmp_path, columns)
+    try:
+        with conn.cursor(name=f"report_{name}") as cur:
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                sink.write(rows)
+                count += len(rows)
+    except BaseException:
+        sink.close()
+        os.remove(tmp_path)
+        raise
+    sink.close()
+    os.replace(tmp_path, path)
+    return path, count, time.perf_counter() - start
+
+def export_report(state, city=None, out_dir="reports", fmt="csv", sections=None, top=10, batch_size=5000, quiet=False):
+    os.makedirs(out_dir, exist_ok=True)
+    prefix = "_".join(part.replace(" ", "-").replace("/", "-") for part in (state, city) if part)
+    params = {"state": state, "city": city, "top": top}
+    conn = db.connect_db(application_name="yelpsim-report")
+    #one read-only snapshot for every section, so stats and rankings agree with each other
+    conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    written = []
+    try:
+        for name in sections or SECTIONS:
+            path, count, elapsed = export_section(conn, name, params, city, SINKS[fmt], out_dir, prefix, batch_size)
+            written.append((path, count))
+            if not quiet:
+                print(f"{name}: {count} rows to {path} in {elapsed:.2f}s")
+        conn.commit()
+    finally:
+        conn.close()
+    return written
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the finder's zipcode panels for every zipcode in a state or city")
+    parser.add_argument("state")
+    parser.add_argument("--city")
+    parser.add_argument("--out", default="reports", help="output directory")
+    parser.add_argument("--format", choices=sorted(SINKS), default="csv")
+    parser.add_argument("--sections", help=f"comma-separated subset of {','.join(SECTIONS)}")
+    parser.add_argument("--top", type=int, default=10, help="businesses per zipcode/category ranking")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per server round trip")
+    parser.add_argument("--quiet", action="store_true", help="only print errors, for cron")
+    args = parser.parse_args()
+
+    sections = args.sections.split(",") if args.sections else None
+    unknown = set(sections or []) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+    start = time.perf_counter()
+    try:
+        written = export_report(args.state, args.city, args.out, args.format, sections, args.top, args.batch_size, args.quiet)
+    except psycopg2.Error as e:
+        print(f"report failed: {str(e).strip()}", file=sys.stderr)
+        sys.exit(1)
+    if not args.quiet:
+        print(f"report: {sum(count for _, count in written)} rows in {time.perf_counter() - start:.2f}s")